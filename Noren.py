@@ -1,5 +1,7 @@
+import asyncio
 import json
 import requests
+import requests.adapters
 import threading
 import websocket
 import logging
@@ -13,6 +15,22 @@ from datetime import datetime as dt
 
 logger = logging.getLogger(__name__)
 
+try:
+    import orjson
+
+    def decode_frame(message):
+        return orjson.loads(message)
+
+except ImportError:
+    decode_frame = json.loads
+
+
+def encode_enum(o):
+    """json.dumps default: enum members go out as their value"""
+    if isinstance(o, Enum):
+        return o.value
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
 
 class position:
     prd: str
@@ -75,6 +93,86 @@ def reportinfo(msg):
     logger.info(msg)
 
 
+class RestSession:
+    """Shared keep-alive session for the REST endpoints.
+
+    Connections are pooled per host, every route gets a timeout (default or from
+    timeouts), read-only routes are retried on connection errors and 5xx/429 with
+    exponential backoff, and per-route latency is recorded in metrics. Order and
+    account mutations are never retried.
+    """
+
+    idempotent_routes = {
+        "/MWList", "/MarketWatch", "/OrderBook", "/TradeBook", "/SingleOrdHist",
+        "/SearchScrip", "/TPSeries", "/GetOptionChain", "/Holdings", "/Limits",
+        "/PositionBook", "/GetSecurityInfo", "/GetQuotes", "/SpanCalc",
+        "/GetOptionGreek", "/EODChartData", "/GetPendingGTTOrder", "/GetEnabledGTTs",
+    }
+    retry_status = {429, 500, 502, 503, 504}
+    route_timeouts = {"/QuickAuth": (3.05, 20), "/TPSeries": (3.05, 30), "/EODChartData": (3.05, 30)}
+
+    def __init__(self, pool_size=16, timeout=(3.05, 10), timeouts=None, retries=2, backoff=0.2):
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.timeout = timeout
+        self.timeouts = {**self.route_timeouts, **(timeouts or {})}
+        self.retries = retries
+        self.backoff = backoff
+        self.metrics = {}
+        self.__metrics_lock = threading.Lock()
+
+    @staticmethod
+    def route_of(url):
+        return "/" + url.rstrip("/").rsplit("/", 1)[-1]
+
+    def post(self, url, data=None, headers=None):
+        route = self.route_of(url)
+        timeout = self.timeouts.get(route, self.timeout)
+        attempts = 1 + (self.retries if route in self.idempotent_routes else 0)
+        for attempt in range(attempts):
+            start = time.perf_counter()
+            failed = True
+            try:
+                res = self.session.post(url, data=data, headers=headers, timeout=timeout)
+                failed = res.status_code in self.retry_status
+                if failed and attempt + 1 < attempts:
+                    sleep(self.backoff * 2**attempt)
+                    continue
+                return res
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if attempt + 1 >= attempts:
+                    raise
+                logger.warning(f"{route} attempt {attempt + 1} failed, retrying : {e}")
+                sleep(self.backoff * 2**attempt)
+            finally:
+                self.__record(route, time.perf_counter() - start, failed)
+
+    def __record(self, route, elapsed, failed):
+        with self.__metrics_lock:
+            stats = self.metrics.get(route)
+            if stats is None:
+                stats = self.metrics[route] = {"calls": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0, "last_ms": 0.0}
+            elapsed_ms = elapsed * 1000
+            stats["calls"] += 1
+            stats["errors"] += failed
+            stats["total_ms"] += elapsed_ms
+            stats["last_ms"] = elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+
+    def latency(self):
+        """route -> calls, errors, avg/max/last latency in ms"""
+        with self.__metrics_lock:
+            return {
+                route: {**stats, "avg_ms": stats["total_ms"] / stats["calls"]}
+                for route, stats in self.metrics.items()
+            }
+
+    def close(self):
+        self.session.close()
+
+
 class NorenApi(object):
 
     TRANSACTION_TYPE_SELL = "S"
@@ -137,11 +235,21 @@ class NorenApi(object):
         # 'eoddata_endpoint' : 'http://eodhost/'
     }
 
-    def __init__(self, host, websocket):
+    def __init__(self, host, websocket, decoder=None, session=None, recorder=None):
         self.__service_config["host"] = host
         self.__service_config["websocket_endpoint"] = websocket
+        self.__session = session or RestSession()
+        # optional recorder.FrameRecorder, gets every raw frame before decode
+        self.__recorder = recorder
+        # feed frames go through orjson when it is installed, json.loads otherwise
+        self.__decode = decoder or decode_frame
+        self.__dispatch = {}
         # self.__service_config['eoddata_endpoint'] = eodhost
 
+        self.__username = None
+        self.__accountid = None
+        self.__password = None
+        self.__susertoken = None
         self.__websocket = None
         self.__websocket_connected = False
         self.__ws_mutex = threading.Lock()
@@ -213,30 +321,29 @@ class NorenApi(object):
         # print(data_type)
         # print(continue_flag)
 
-        res = json.loads(message)
+        if self.__recorder is not None:
+            self.__recorder.record(message)
+        res = self.__decode(message)
+        handler = self.__dispatch.get(res.get("t"))
+        if handler is not None:
+            handler(res)
 
-        if self.__subscribe_callback is not None:
-            if res["t"] == "tk" or res["t"] == "tf":
-                self.__subscribe_callback(res)
-                return
-            if res["t"] == "dk" or res["t"] == "df":
-                self.__subscribe_callback(res)
-                return
-
-        if self.__on_error is not None:
-            if res["t"] == "ck" and res["s"] != "OK":
+    def __on_connect_ack(self, res):
+        if res["s"] != "OK":
+            if self.__on_error is not None:
                 self.__on_error(res)
-                return
+        elif self.__on_open:
+            self.__on_open()
 
+    def __build_dispatch(self):
+        """Message type -> callback, built once per start_websocket"""
+        dispatch = {"ck": self.__on_connect_ack}
+        if self.__subscribe_callback is not None:
+            for message_type in ("tk", "tf", "dk", "df"):
+                dispatch[message_type] = self.__subscribe_callback
         if self.__order_update_callback is not None:
-            if res["t"] == "om":
-                self.__order_update_callback(res)
-                return
-
-        if self.__on_open:
-            if res["t"] == "ck" and res["s"] == "OK":
-                self.__on_open()
-                return
+            dispatch["om"] = self.__order_update_callback
+        self.__dispatch = dispatch
 
     def start_websocket(
         self,
@@ -252,6 +359,7 @@ class NorenApi(object):
         self.__on_error = socket_error_callback
         self.__subscribe_callback = subscribe_callback
         self.__order_update_callback = order_update_callback
+        self.__build_dispatch()
         self.__stop_event = threading.Event()
         url = self.__service_config["websocket_endpoint"].format(
             access_token=self.__susertoken
@@ -274,13 +382,22 @@ class NorenApi(object):
         self.__ws_thread.daemon = True
         self.__ws_thread.start()
 
+    def websocket_connected(self):
+        return self.__websocket_connected
+
+    def set_recorder(self, recorder):
+        """Record raw feed frames with recorder (None stops recording)"""
+        self.__recorder = recorder
+
     def close_websocket(self):
-        if self.__websocket_connected == False:
+        # also stops a socket that never opened, which otherwise keeps reconnecting
+        if self.__websocket is None:
             return
         self.__stop_event.set()
         self.__websocket_connected = False
         self.__websocket.close()
         self.__ws_thread.join()
+        self.__websocket = None
 
     def login(self, userid, password, twoFA, vendor_code, api_secret, imei):
         config = NorenApi.__service_config
@@ -305,7 +422,7 @@ class NorenApi(object):
         payload = "jData=" + json.dumps(values)
         reportmsg("Req:" + payload)
 
-        res = requests.post(url, data=payload)
+        res = self.__session.post(url, data=payload)
         reportmsg("Reply:" + res.text)
 
         resDict = json.loads(res.text)
@@ -331,6 +448,12 @@ class NorenApi(object):
 
         return True
 
+    def session_credentials(self):
+        """(userid, password, usertoken) of the logged in session, None when logged out"""
+        if self.__username is None:
+            return None
+        return self.__username, self.__password, self.__susertoken
+
     def forgot_password(self, userid, pan, dob):
         config = NorenApi.__service_config
 
@@ -347,7 +470,7 @@ class NorenApi(object):
         payload = "jData=" + json.dumps(values)
         reportmsg("Req:" + payload)
 
-        res = requests.post(url, data=payload)
+        res = self.__session.post(url, data=payload)
         reportmsg("Reply:" + res.text)
 
         resDict = json.loads(res.text)
@@ -371,7 +494,7 @@ class NorenApi(object):
 
         reportmsg(payload)
 
-        res = requests.post(url, data=payload)
+        res = self.__session.post(url, data=payload)
         reportmsg(res.text)
 
         resDict = json.loads(res.text)
@@ -446,7 +569,7 @@ class NorenApi(object):
 
         reportmsg(payload)
 
-        res = requests.post(url, data=payload)
+        res = self.__session.post(url, data=payload)
         reportmsg(res.text)
 
         resDict = json.loads(res.text)
@@ -470,7 +593,7 @@ class NorenApi(object):
 
         reportmsg(payload)
 
-        res = requests.post(url, data=payload)
+        res = self.__session.post(url, data=payload)
         reportmsg(res.text)
 
         resDict = json.loads(res.text)
@@ -498,7 +621,7 @@ class NorenApi(object):
 
         reportmsg(payload)
 
-        res = requests.post(url, data=payload)
+        res = self.__session.post(url, data=payload)
         reportmsg(res.text)
 
         resDict = json.loads(res.text)
@@ -526,7 +649,7 @@ class NorenApi(object):
 
         reportmsg(payload)
 
-        res = requests.post(url, data=payload)
+        res = self.__session.post(url, data=payload)
         reportmsg(res.text)
 
         resDict = json.loads(res.text)
@@ -594,7 +717,7 @@ class NorenApi(object):
 
         reportmsg(payload)
 
-        res = requests.post(url, data=payload)
+        res = self.__session.post(url, data=payload)
         reportmsg(res.text)
 
         resDict = json.loads(res.text)
@@ -654,7 +777,7 @@ class NorenApi(object):
 
         reportmsg(payload)
 
-        res = requests.post(url, data=payload)
+        res = self.__session.post(url, data=payload)
         reportmsg(res.text)
 
         resDict = json.loads(res.text)
@@ -679,7 +802,7 @@ class NorenApi(object):
 
         reportmsg(payload)
 
-        res = requests.post(url, data=payload)
+        res = self.__session.post(url, data=payload)
         print(res.text)
 
         resDict = json.loads(res.text)
@@ -705,7 +828,7 @@ class NorenApi(object):
 
         reportmsg(payload)
 
-        res = requests.post(url, data=payload)
+        res = self.__session.post(url, data=payload)
         reportmsg(res.text)
 
         resDict = json.loads(res.text)
@@ -749,7 +872,7 @@ class NorenApi(object):
 
         reportmsg(payload)
 
-        res = requests.post(url, data=payload)
+        res = self.__session.post(url, data=payload)
         reportmsg(res.text)
 
         resDict = json.loads(res.text)
@@ -775,7 +898,7 @@ class NorenApi(object):
 
         reportmsg(payload)
 
-        res = requests.post(url, data=payload)
+        res = self.__session.post(url, data=payload)
         reportmsg(res.text)
 
         resDict = json.loads(res.text)
@@ -800,7 +923,7 @@ class NorenApi(object):
 
         reportmsg(payload)
 
-        res = requests.post(url, data=payload)
+        res = self.__session.post(url, data=payload)
         reportmsg(res.text)
 
         resDict = json.loads(res.text)
@@ -827,7 +950,7 @@ class NorenApi(object):
 
         reportmsg(payload)
 
-        res = requests.post(url, data=payload)
+        res = self.__session.post(url, data=payload)
         reportmsg(res.text)
 
         resDict = json.loads(res.text)
@@ -858,7 +981,7 @@ class NorenApi(object):
 
         reportmsg(payload)
 
-        res = requests.post(url, data=payload)
+        res = self.__session.post(url, data=payload)
         reportmsg(res.text)
 
         resDict = json.loads(res.text)
@@ -886,7 +1009,7 @@ class NorenApi(object):
 
         reportmsg(payload)
 
-        res = requests.post(url, data=payload)
+        res = self.__session.post(url, data=payload)
         reportmsg(res.text)
 
         resDict = json.loads(res.text)
@@ -912,7 +1035,7 @@ class NorenApi(object):
 
         reportmsg(payload)
 
-        res = requests.post(url, data=payload)
+        res = self.__session.post(url, data=payload)
         reportmsg(res.text)
 
         resDict = json.loads(res.text)
@@ -938,7 +1061,7 @@ class NorenApi(object):
 
         reportmsg(payload)
 
-        res = requests.post(url, data=payload)
+        res = self.__session.post(url, data=payload)
         reportmsg(res.text)
 
         resDict = json.loads(res.text)
@@ -982,7 +1105,7 @@ class NorenApi(object):
 
         reportmsg(payload)
 
-        res = requests.post(url, data=payload)
+        res = self.__session.post(url, data=payload)
         reportmsg(res.text)
 
         resDict = json.loads(res.text)
@@ -1023,7 +1146,7 @@ class NorenApi(object):
         reportmsg(payload)
 
         headers = {"Content-Type": "application/json; charset=utf-8"}
-        res = requests.post(url, data=payload, headers=headers)
+        res = self.__session.post(url, data=payload, headers=headers)
         reportmsg(res)
 
         if res.status_code != 200:
@@ -1059,7 +1182,7 @@ class NorenApi(object):
 
         reportmsg(payload)
 
-        res = requests.post(url, data=payload)
+        res = self.__session.post(url, data=payload)
         reportmsg(res.text)
 
         resDict = json.loads(res.text)
@@ -1093,7 +1216,7 @@ class NorenApi(object):
 
         reportmsg(payload)
 
-        res = requests.post(url, data=payload)
+        res = self.__session.post(url, data=payload)
         reportmsg(res.text)
 
         resDict = json.loads(res.text)
@@ -1115,7 +1238,7 @@ class NorenApi(object):
 
         reportmsg(payload)
 
-        res = requests.post(url, data=payload)
+        res = self.__session.post(url, data=payload)
         reportmsg(res.text)
 
         resDict = json.loads(res.text)
@@ -1141,7 +1264,7 @@ class NorenApi(object):
         )
         reportmsg(payload)
 
-        res = requests.post(url, data=payload)
+        res = self.__session.post(url, data=payload)
         reportmsg(res.text)
 
         resDict = json.loads(res.text)
@@ -1171,7 +1294,7 @@ class NorenApi(object):
 
         reportmsg(payload)
 
-        res = requests.post(url, data=payload)
+        res = self.__session.post(url, data=payload)
         reportmsg(res.text)
 
         resDict = json.loads(res.text)
@@ -1193,7 +1316,7 @@ class NorenApi(object):
 
         reportmsg(payload)
 
-        res = requests.post(url, data=payload)
+        res = self.__session.post(url, data=payload)
         reportmsg(res.text)
 
         resDict = json.loads(res.text)
@@ -1219,7 +1342,7 @@ class NorenApi(object):
 
         reportmsg(payload)
 
-        res = requests.post(url, data=payload)
+        res = self.__session.post(url, data=payload)
         reportmsg(res.text)
 
         resDict = json.loads(res.text)
@@ -1244,7 +1367,7 @@ class NorenApi(object):
         payload = "jData=" + json.dumps(values) + f"&jKey={self.__susertoken}"
         reportmsg(payload)
 
-        res = requests.post(url, data=payload)
+        res = self.__session.post(url, data=payload)
         reportmsg(res.text)
 
         resDict = json.loads(res.text)
@@ -1296,7 +1419,7 @@ class NorenApi(object):
         payload = "jData=" + json.dumps(values) + f"&jKey={self.__susertoken}"
         reportmsg(payload)
 
-        res = requests.post(url, data=payload)
+        res = self.__session.post(url, data=payload)
         reportmsg(res.text)
 
         resDict = json.loads(res.text)
@@ -1347,7 +1470,7 @@ class NorenApi(object):
         payload = "jData=" + json.dumps(values) + f"&jKey={self.__susertoken}"
         reportmsg(payload)
 
-        res = requests.post(url, data=payload)
+        res = self.__session.post(url, data=payload)
         reportmsg(res.text)
 
         resDict = json.loads(res.text)
@@ -1410,7 +1533,7 @@ class NorenApi(object):
         payload = "jData=" + json.dumps(values) + f"&jKey={self.__susertoken}"
         reportmsg(payload)
 
-        res = requests.post(url, data=payload)
+        res = self.__session.post(url, data=payload)
         reportmsg(res.text)
 
         resDict = json.loads(res.text)
@@ -1488,7 +1611,7 @@ class NorenApi(object):
         payload = "jData=" + json.dumps(values) + f"&jKey={self.__susertoken}"
         reportmsg(payload)
 
-        res = requests.post(url, data=payload)
+        res = self.__session.post(url, data=payload)
         reportmsg(res.text)
 
         resDict = json.loads(res.text)
@@ -1552,7 +1675,7 @@ class NorenApi(object):
         payload = "jData=" + json.dumps(values) + f"&jKey={self.__susertoken}"
         print(payload)
 
-        res = requests.post(url, data=payload)
+        res = self.__session.post(url, data=payload)
         print(res.text)
 
         resDict = json.loads(res.text)
@@ -1632,7 +1755,7 @@ class NorenApi(object):
         payload = "jData=" + json.dumps(values) + f"&jKey={self.__susertoken}"
         print(payload)
 
-        res = requests.post(url, data=payload)
+        res = self.__session.post(url, data=payload)
         print(res.text)
 
         resDict = json.loads(res.text)
@@ -1640,3 +1763,388 @@ class NorenApi(object):
             return None
 
         return resDict["al_id"]
+
+
+class AsyncNorenApi(object):
+    """Coroutine flavour of the NorenApi REST endpoints on a shared httpx.AsyncClient.
+
+    The endpoints take the same arguments and return the same values as their
+    NorenApi counterparts. get_quotes_many / get_security_info_many fan a list of
+    tokens out concurrently, at most `concurrency` requests in flight at a time.
+    The GTT/OCO helpers and the websocket stay on NorenApi.
+    """
+
+    __service_config = dict(NorenApi._NorenApi__service_config)
+
+    def __init__(self, host, websocket=None, client=None, concurrency=16, retries=2, backoff=0.2):
+        # httpx is only imported once an async client is built, importing this module stays light
+        import httpx
+
+        # per instance, so the async client never repoints the sync NorenApi (or another client)
+        self.__service_config = dict(self.__service_config, host=host)
+        if websocket is not None:
+            self.__service_config["websocket_endpoint"] = websocket
+        self.__client = client or httpx.AsyncClient(
+            timeout=httpx.Timeout(10, connect=3.05),
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+        )
+        self.__limit = asyncio.Semaphore(concurrency)
+        self.retries = retries
+        self.backoff = backoff
+        self.__username = None
+        self.__accountid = None
+        self.__password = None
+        self.__susertoken = None
+
+    @classmethod
+    def from_api(cls, api, **kwargs):
+        """async client sharing the host and logged in session of a NorenApi"""
+        client = cls(host=NorenApi._NorenApi__service_config["host"], **kwargs)
+        credentials = api.session_credentials()
+        if credentials is not None:
+            client.set_session(*credentials)
+        return client
+
+    async def __post(self, route, values, with_key=True, headers=None):
+        url = f"{self.__service_config['host']}{self.__service_config['routes'][route]}"
+        reportmsg(url)
+        payload = "jData=" + json.dumps(values, default=encode_enum)
+        if with_key:
+            payload += f"&jKey={self.__susertoken}"
+        reportmsg(payload)
+
+        import httpx
+
+        path = RestSession.route_of(url)
+        timeout = RestSession.route_timeouts.get(path)
+        attempts = 1 + (self.retries if path in RestSession.idempotent_routes else 0)
+        async with self.__limit:
+            for attempt in range(attempts):
+                try:
+                    res = await self.__client.post(
+                        url,
+                        content=payload.encode(),
+                        headers=headers,
+                        timeout=httpx.Timeout(timeout[1], connect=timeout[0]) if timeout else httpx.USE_CLIENT_DEFAULT,
+                    )
+                    if res.status_code in RestSession.retry_status and attempt + 1 < attempts:
+                        await asyncio.sleep(self.backoff * 2**attempt)
+                        continue
+                    reportmsg(res.text)
+                    return res
+                except (httpx.ConnectError, httpx.TimeoutException) as e:
+                    if attempt + 1 >= attempts:
+                        raise
+                    logger.warning(f"{path} attempt {attempt + 1} failed, retrying : {e}")
+                    await asyncio.sleep(self.backoff * 2**attempt)
+
+    async def __ok(self, route, values, **kwargs):
+        resDict = json.loads((await self.__post(route, values, **kwargs)).text)
+        if resDict["stat"] != "Ok":
+            return None
+        return resDict
+
+    async def __list(self, route, values):
+        resDict = json.loads((await self.__post(route, values)).text)
+        # error is a json with stat and msg
+        if type(resDict) != list:
+            return None
+        return resDict
+
+    async def login(self, userid, password, twoFA, vendor_code, api_secret, imei):
+        pwd = hashlib.sha256(password.encode("utf-8")).hexdigest()
+        app_key = hashlib.sha256(f"{userid}|{api_secret}".encode("utf-8")).hexdigest()
+        values = {"source": "API", "apkversion": "1.0.0"}
+        values.update(uid=userid, pwd=pwd, factor2=twoFA, vc=vendor_code, appkey=app_key, imei=imei)
+
+        resDict = await self.__ok("authorize", values, with_key=False)
+        if resDict is None:
+            return None
+
+        self.set_session(userid, password, resDict["susertoken"])
+        return resDict
+
+    def set_session(self, userid, password, usertoken):
+        self.__username = userid
+        self.__accountid = userid
+        self.__password = password
+        self.__susertoken = usertoken
+        return True
+
+    async def forgot_password(self, userid, pan, dob):
+        values = {"source": "API", "uid": userid, "pan": pan, "dob": dob}
+        return await self.__ok("forgot_password", values, with_key=False)
+
+    async def logout(self):
+        resDict = await self.__ok("logout", {"ordersource": "API", "uid": self.__username})
+        if resDict is not None:
+            self.set_session(None, None, None)
+        return resDict
+
+    async def get_watch_list_names(self):
+        return await self.__ok("watchlist_names", {"ordersource": "API", "uid": self.__username})
+
+    async def get_watch_list(self, wlname):
+        return await self.__ok("watchlist", {"ordersource": "API", "uid": self.__username, "wlname": wlname})
+
+    async def add_watch_list_scrip(self, wlname, instrument):
+        scrips = "#".join(instrument) if type(instrument) == list else instrument
+        values = {"ordersource": "API", "uid": self.__username, "wlname": wlname, "scrips": scrips}
+        return await self.__ok("watchlist_add", values)
+
+    async def delete_watch_list_scrip(self, wlname, instrument):
+        scrips = "#".join(instrument) if type(instrument) == list else instrument
+        values = {"ordersource": "API", "uid": self.__username, "wlname": wlname, "scrips": scrips}
+        return await self.__ok("watchlist_delete", values)
+
+    async def place_order(
+        self,
+        buy_or_sell,
+        product_type,
+        exchange,
+        tradingsymbol,
+        quantity,
+        discloseqty,
+        price_type,
+        price=0.0,
+        trigger_price=None,
+        retention="DAY",
+        amo="NO",
+        remarks=None,
+        bookloss_price=0.0,
+        bookprofit_price=0.0,
+        trail_price=0.0,
+    ):
+        values = {"ordersource": "API"}
+        values["uid"] = self.__username
+        values["actid"] = self.__accountid
+        values["trantype"] = buy_or_sell
+        values["prd"] = product_type
+        values["exch"] = exchange
+        values["tsym"] = urllib.parse.quote_plus(tradingsymbol)
+        values["qty"] = str(quantity)
+        values["dscqty"] = str(discloseqty)
+        values["prctyp"] = price_type
+        values["prc"] = str(price)
+        values["trgprc"] = str(trigger_price)
+        values["ret"] = retention
+        values["remarks"] = remarks
+        values["amo"] = amo
+
+        # cover / high leverage and bracket orders
+        if product_type in ("H", "B"):
+            values["blprc"] = str(bookloss_price)
+            if product_type == "B":
+                values["bpprc"] = str(bookprofit_price)
+            if trail_price != 0.0:
+                values["trailprc"] = str(trail_price)
+
+        return await self.__ok("placeorder", values)
+
+    async def modify_order(
+        self,
+        orderno,
+        exchange,
+        tradingsymbol,
+        newquantity,
+        newprice_type,
+        newprice=0.0,
+        newtrigger_price=None,
+        bookloss_price=0.0,
+        bookprofit_price=0.0,
+        trail_price=0.0,
+    ):
+        values = {"ordersource": "API"}
+        values["uid"] = self.__username
+        values["actid"] = self.__accountid
+        values["norenordno"] = str(orderno)
+        values["exch"] = exchange
+        values["tsym"] = urllib.parse.quote_plus(tradingsymbol)
+        values["qty"] = str(newquantity)
+        values["prctyp"] = newprice_type
+        values["prc"] = str(newprice)
+
+        if (newprice_type == "SL-LMT") or (newprice_type == "SL-MKT"):
+            if newtrigger_price != None:
+                values["trgprc"] = str(newtrigger_price)
+            else:
+                reporterror("trigger price is missing")
+                return None
+
+        if bookloss_price != 0.0:
+            values["blprc"] = str(bookloss_price)
+        if trail_price != 0.0:
+            values["trailprc"] = str(trail_price)
+        if bookprofit_price != 0.0:
+            values["bpprc"] = str(bookprofit_price)
+
+        return await self.__ok("modifyorder", values)
+
+    async def cancel_order(self, orderno):
+        values = {"ordersource": "API", "uid": self.__username, "norenordno": str(orderno)}
+        return await self.__ok("cancelorder", values)
+
+    async def exit_order(self, orderno, product_type):
+        values = {"ordersource": "API", "uid": self.__username, "norenordno": orderno, "prd": product_type}
+        return await self.__ok("exitorder", values)
+
+    async def position_product_conversion(
+        self,
+        exchange,
+        tradingsymbol,
+        quantity,
+        new_product_type,
+        previous_product_type,
+        buy_or_sell,
+        day_or_cf,
+    ):
+        values = {"ordersource": "API"}
+        values["uid"] = self.__username
+        values["actid"] = self.__accountid
+        values["exch"] = exchange
+        values["tsym"] = urllib.parse.quote_plus(tradingsymbol)
+        values["qty"] = str(quantity)
+        values["prd"] = new_product_type
+        values["prevprd"] = previous_product_type
+        values["trantype"] = buy_or_sell
+        values["postype"] = day_or_cf
+        return await self.__ok("product_conversion", values)
+
+    async def single_order_history(self, orderno):
+        values = {"ordersource": "API", "uid": self.__username, "norenordno": orderno}
+        return await self.__list("singleorderhistory", values)
+
+    async def get_order_book(self):
+        return await self.__list("orderbook", {"ordersource": "API", "uid": self.__username})
+
+    async def get_trade_book(self):
+        values = {"ordersource": "API", "uid": self.__username, "actid": self.__accountid}
+        return await self.__list("tradebook", values)
+
+    async def searchscrip(self, exchange, searchtext):
+        if searchtext == None:
+            reporterror("search text cannot be null")
+            return None
+        values = {"uid": self.__username, "exch": exchange, "stext": urllib.parse.quote_plus(searchtext)}
+        return await self.__ok("searchscrip", values)
+
+    async def get_option_chain(self, exchange, tradingsymbol, strikeprice, count=2):
+        values = {"uid": self.__username, "exch": exchange}
+        values["tsym"] = urllib.parse.quote_plus(tradingsymbol)
+        values["strprc"] = str(strikeprice)
+        values["cnt"] = str(count)
+        return await self.__ok("optionchain", values)
+
+    async def get_security_info(self, exchange, token):
+        return await self.__ok("scripinfo", {"uid": self.__username, "exch": exchange, "token": token})
+
+    async def get_quotes(self, exchange, token):
+        return await self.__ok("getquotes", {"uid": self.__username, "exch": exchange, "token": token})
+
+    async def __many(self, fetch, exchange, tokens):
+        results = await asyncio.gather(*(fetch(exchange, token) for token in tokens), return_exceptions=True)
+        for token, result in zip(tokens, results):
+            if isinstance(result, Exception):
+                logger.debug("Error fetching {} {} :: {}".format(exchange, token, result))
+        return {
+            token: result
+            for token, result in zip(tokens, results)
+            if result is not None and not isinstance(result, Exception)
+        }
+
+    async def get_quotes_many(self, exchange, tokens):
+        """token -> quote for every token that answered Ok, fetched concurrently"""
+        return await self.__many(self.get_quotes, exchange, list(tokens))
+
+    async def get_security_info_many(self, exchange, tokens):
+        """token -> security info for every token that answered Ok, fetched concurrently"""
+        return await self.__many(self.get_security_info, exchange, list(tokens))
+
+    async def get_time_price_series(
+        self, exchange, token, starttime=None, endtime=None, interval=None
+    ):
+        """
+        gets the chart data
+        interval possible values 1, 3, 5 , 10, 15, 30, 60, 120, 240
+        """
+        if starttime == None:
+            timestring = time.strftime("%d-%m-%Y") + " 00:00:00"
+            timeobj = time.strptime(timestring, "%d-%m-%Y %H:%M:%S")
+            starttime = time.mktime(timeobj)
+
+        values = {"ordersource": "API", "uid": self.__username, "exch": exchange, "token": token}
+        values["st"] = str(starttime)
+        if endtime != None:
+            values["et"] = str(endtime)
+        if interval != None:
+            values["intrv"] = str(interval)
+        return await self.__list("TPSeries", values)
+
+    async def get_daily_price_series(
+        self, exchange, tradingsymbol, startdate=None, enddate=None
+    ):
+        if startdate == None:
+            week_ago = datetime.date.today() - datetime.timedelta(days=7)
+            startdate = dt.combine(week_ago, dt.min.time()).timestamp()
+
+        if enddate == None:
+            enddate = dt.now().timestamp()
+
+        values = {"uid": self.__username}
+        values["sym"] = "{0}:{1}".format(exchange, tradingsymbol)
+        values["from"] = str(startdate)
+        values["to"] = str(enddate)
+
+        headers = {"Content-Type": "application/json; charset=utf-8"}
+        res = await self.__post("get_daily_price_series", values, headers=headers)
+        if res.status_code != 200 or len(res.text) == 0:
+            return None
+
+        resDict = json.loads(res.text)
+        if type(resDict) != list:
+            return None
+        return resDict
+
+    async def get_holdings(self, product_type=None):
+        if product_type == None:
+            product_type = ProductType.Delivery
+        values = {"uid": self.__username, "actid": self.__accountid, "prd": product_type}
+        return await self.__list("holdings", values)
+
+    async def get_limits(self, product_type=None, segment=None, exchange=None):
+        values = {"uid": self.__username, "actid": self.__accountid}
+        if product_type != None:
+            values["prd"] = product_type
+            values["seg"] = segment
+        if exchange != None:
+            values["exch"] = exchange
+        return json.loads((await self.__post("limits", values)).text)
+
+    async def get_positions(self):
+        return await self.__list("positions", {"uid": self.__username, "actid": self.__accountid})
+
+    async def span_calculator(self, positions: list):
+        values = {"actid": self.__accountid, "pos": positions}
+        return json.loads((await self.__post("span_calculator", values)).text)
+
+    async def option_greek(
+        self, expiredate, StrikePrice, SpotPrice, InterestRate, Volatility, OptionType
+    ):
+        values = {"source": "API"}
+        values["actid"] = self.__accountid
+        values["exd"] = expiredate
+        values["strprc"] = StrikePrice
+        values["sptprc"] = SpotPrice
+        values["int_rate"] = InterestRate
+        values["volatility"] = Volatility
+        values["optt"] = OptionType
+        return json.loads((await self.__post("option_greek", values)).text)
+
+    async def get_pending_gtt_orders(self):
+        return await self.__list("gtt", {"ordersource": "API", "uid": self.__username})
+
+    async def get_enabled_gtt_orders(self):
+        return await self.__list("enabledgtt", {"ordersource": "API", "uid": self.__username})
+
+    async def close(self):
+        await self.__client.aclose()
@@ -1,178 +1,220 @@
-import yaml
-import pyotp
-import threading
-from symbolsearch import SearchScrip
-from PyQt5 import uic,  QtWidgets
+import time
+STARTED = time.perf_counter()
+import hashlib
+import importlib
+import io
+import os
+from PyQt5 import QtWidgets, QtCore
 import sys
-from shared import SharedDict, SharedList
-from utils import IndexTableDataFetcher, ChainMaker, OptionChainDataFetcher, WebSocketMonitor
 from models import IndexTableModel, OptionChainTableModel
-from socket_utils import WebSocketHandler, WSSubscriber
-from others import ShoonyaApiPy, check_symbols  
-from datetime import datetime
-
-Ui_MainWindow, QtBaseClass = uic.loadUiType("MyUi.ui")
+from engine import StreamingEngine, Startup, Sink
+
+def load_ui(ui_file="MyUi.ui", module="ui_MyUi"):
+    '''Ui_MainWindow from a module compiled out of ui_file. The module is regenerated
+    whenever the .ui content changes (its hash is kept in the first line), so launches
+    skip the XML parse and import a cached .pyc instead.'''
+    l_path = os.path.dirname(os.path.abspath(__file__))
+    ui_path = os.path.join(l_path, ui_file)
+    py_path = os.path.join(l_path, f"{module}.py")
+    with open(ui_path, 'rb') as f:
+        stamp = f"# ui-sha1: {hashlib.sha1(f.read()).hexdigest()}\n"
+    try:
+        with open(py_path) as f:
+            fresh = f.readline() == stamp
+    except OSError:
+        fresh = False
+    if not fresh:
+        from PyQt5 import uic
+        out = io.StringIO()
+        uic.compileUi(ui_path, out)
+        with open(py_path, 'w') as f:
+            f.write(stamp + out.getvalue())
+        importlib.invalidate_caches()
+    return importlib.import_module(module).Ui_MainWindow
+
+class StartupProfile:
+    '''Wall time per startup phase for --profile-startup, counted from the first line
+    of this module (interpreter start-up itself is not included).'''
+    def __init__(self, started=STARTED):
+        self.started = self.last = started
+        self.phases = []
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases.append((phase, (now - self.last) * 1000))
+        self.last = now
+
+    def report(self, file=sys.stdout):
+        for phase, elapsed in self.phases:
+            print(f"{phase:<28} :: {elapsed:8.1f} ms", file=file)
+        print(f"{'total':<28} :: {(self.last - self.started) * 1000:8.1f} ms", file=file)
+
+Ui_MainWindow = load_ui()
+
+class QtSink(QtCore.QObject, Sink):
+    '''Engine sink for the window. Engine callbacks arrive on worker threads; re-emitting
+    them as Qt signals queues them onto the GUI thread.'''
+    index_ready = QtCore.pyqtSignal(object)
+    chain_ready = QtCore.pyqtSignal(str, object, object)
+    atm_ready = QtCore.pyqtSignal(str, object)
+    status_ready = QtCore.pyqtSignal(str)
+    chain_added = QtCore.pyqtSignal(str, object)
+    progress_ready = QtCore.pyqtSignal(int, int, str)
+
+    def on_index(self, table):
+        self.index_ready.emit(table)
+
+    def on_chain(self, symbol, expiry, table):
+        self.chain_ready.emit(symbol, expiry, table)
+
+    def on_atm(self, symbol, atm):
+        self.atm_ready.emit(symbol, atm)
+
+    def on_status(self, text):
+        self.status_ready.emit(text)
+
+    def on_chain_added(self, symbol, expiries):
+        self.chain_added.emit(symbol, expiries)
+
+    def on_progress(self, done, total, text):
+        self.progress_ready.emit(done, total, text)
 
 class OCStreamer(QtWidgets.QMainWindow, Ui_MainWindow):
-    api = ShoonyaApiPy()
-    feedJson = SharedDict() 
-    orderJson = SharedDict()
-    update_freq = 1000
-
-    indices = {'nifty': '26000', 
-               'banknifty': '26009', 
-               'finnifty': '26037', 
-               'vix': '26017',
-               }
+    max_fps = 10
+    expiries = ('current', 'next')
     
-    def __init__(self):
+    def __init__(self, profile=None, record_dir=None):
         super(OCStreamer, self).__init__()
+        self.profile = profile or StartupProfile()
         self.setupUi(self)
+        self.profile.mark("setupUi")
         #self.setWindowFlags(QtCore.Qt.FramelessWindowHint)
-        self.sc = SearchScrip()
-        self.tokenlist = SharedList()
-        self.subscribed_list = SharedList()
-
-        self.init_symbolsearch()
-
-        self.wss_monitor = WebSocketMonitor("26009", self.feedJson, 60)
-        self.wss_monitor.start()
-
-        self.subscriber = WSSubscriber(self.subscribed_list,self.api) #self.tokenlist, 
-        self.wbhandler = WebSocketHandler(self.subscribed_list,self.feedJson, self.orderJson,self.subscriber, self.api)
+        self.engine = StreamingEngine(symbols=("BANKNIFTY", "NIFTY", "FINNIFTY"), expiries=self.expiries,
+                                      no_of_strikes=10, max_fps=self.max_fps, record_dir=record_dir)
+        self.api = self.engine.api
+        self.sink = QtSink(self)
+        self.sink.index_ready.connect(self.update_table_model)
+        self.sink.chain_ready.connect(self.update_option_table_model)
+        self.sink.atm_ready.connect(self.update_atm_strike)
+        self.sink.status_ready.connect(self.update_login_label)
+        self.sink.chain_added.connect(self.add_chain)
+        self.sink.progress_ready.connect(self.update_progress)
+        self.engine.add_sink(self.sink)
+        self.startup = None
        
-        self.BtnLogin.clicked.connect(lambda: self.run_thread(thread_name="login", timeout=10))
-        self.BtnLogOut.clicked.connect(lambda: self.run_thread(thread_name="logout", timeout=10))
+        self.BtnLogin.clicked.connect(self.ShoonyaLogin)
+        self.BtnLogOut.clicked.connect(self.ShoonyaLogout)
 
         self.index_table_model = IndexTableModel([])
         self.IndexTable.setModel(self.index_table_model)
 
-        self.banknifty_option_table_model = OptionChainTableModel([], parent=self.OCTable_Banknifty)
-        self.OCTable_Banknifty.setModel(self.banknifty_option_table_model)
-
-        self.nifty_option_table_model = OptionChainTableModel([], parent=self.OCTable_Nifty)
-        self.OCTable_Nifty.setModel(self.nifty_option_table_model)
-
-        self.finnifty_option_table_model = OptionChainTableModel([], parent=self.OCTable_Finnifty)
-        self.OCTable_Finnifty.setModel(self.finnifty_option_table_model)
-
-        self.update_login_label("Please Press Login to Continue")
-
-        self.index_fetcher = IndexTableDataFetcher(self.feedJson, self.indices, self.update_freq)
-        self.index_fetcher.table_model = self.index_table_model 
-        self.index_fetcher.table_data_ready.connect(self.update_table_model)
-        self.index_fetcher.start()  
-        
-        self.banknifty_chain = ChainMaker(self.api, self.sc, self.feedJson, self.indices, "BANKNIFTY", 10, self.update_freq)        
-        self.banknifty_chain.start()
-        self.banknifty_chain.chain_list_ready.connect(self.subscriber.update_newsublist) #banknifty_
-        self.banknifty_chain.atmstrike_ready.connect(self.banknifty_option_table_model.set_highlight_value)
-
-        self.banknifty_fetcher = OptionChainDataFetcher(self.feedJson, self.update_freq)
-        self.banknifty_fetcher.table_model = self.banknifty_option_table_model
-        self.banknifty_chain.tokendict_ready.connect(self.banknifty_fetcher.process_token_dict)
-        self.banknifty_fetcher.table_data_ready.connect(lambda table_data: self.update_option_table_model(self.banknifty_option_table_model, table_data))
-        self.banknifty_fetcher.start()
-
-        self.nifty_chain = ChainMaker(self.api, self.sc, self.feedJson, self.indices, "NIFTY", 10, self.update_freq)        
-        self.nifty_chain.start()
-        self.nifty_chain.chain_list_ready.connect(self.subscriber.update_newsublist) # nifty_
-        self.nifty_chain.atmstrike_ready.connect(self.nifty_option_table_model.set_highlight_value)               
-
-        self.nifty_fetcher = OptionChainDataFetcher(self.feedJson, self.update_freq)
-        self.nifty_fetcher.table_model = self.nifty_option_table_model
-        self.nifty_chain.tokendict_ready.connect(self.nifty_fetcher.process_token_dict)
-        self.nifty_fetcher.table_data_ready.connect(lambda table_data: self.update_option_table_model(self.nifty_option_table_model, table_data))
-        self.nifty_fetcher.start()
-
-        self.finnifty_chain = ChainMaker(self.api, self.sc, self.feedJson, self.indices, "FINNIFTY", 10, self.update_freq)        
-        self.finnifty_chain.start()
-        self.finnifty_chain.chain_list_ready.connect(self.subscriber.update_newsublist) # finnifty_
-        self.finnifty_chain.atmstrike_ready.connect(self.finnifty_option_table_model.set_highlight_value)         
-
-        self.finnifty_fetcher = OptionChainDataFetcher(self.feedJson, self.update_freq)
-        self.finnifty_fetcher.table_model = self.finnifty_option_table_model
-        self.finnifty_chain.tokendict_ready.connect(self.finnifty_fetcher.process_token_dict)
-        self.finnifty_fetcher.table_data_ready.connect(lambda table_data: self.update_option_table_model(self.finnifty_option_table_model, table_data))
-        self.finnifty_fetcher.start()
-
-    def init_symbolsearch(self):
-        print("Initializing Symbols...")
-        exch_list = ["NSE", "NFO"]
-        #self.sc.initialize_symbols(exch_list=exch_list)
-        today = datetime.now().date()
-        isInitialized = check_symbols(sc=self.sc, exch_list=exch_list, current_date=today)
-        if not isInitialized:
-            QtWidgets.QApplication.quit() 
+        self.chain_tables = {}
+        self.chain_templates = {"BANKNIFTY": self.OCTable_Banknifty,
+                                "NIFTY": self.OCTable_Nifty,
+                                "FINNIFTY": self.OCTable_Finnifty,
+                                }
+        self.update_login_label("Logging in...")
+        self.profile.mark("window")
+
+    def start_engine(self):
+        '''Starts the background startup (symbol master, login, websocket, chains) and
+        returns at once; chain tables appear as each chain becomes ready.'''
+        self.startup = Startup(self.engine).run()
+
+    def update_progress(self, done, total, text):
+        self.statusbar.showMessage(f"[{done}/{total}] {text}")
+        self.profile.mark(text)
+
+    def add_chain(self, symbol, expiries):
+        '''Tables for every expiry the engine streams for symbol. The first expiry goes to
+        the table from the .ui, later ones get their own tab next to it.'''
+        table = self.chain_templates[symbol]
+        tab_index = self.tabWidget.indexOf(table.parentWidget())
+        for n, expiry in enumerate(expiries):
+            if n:
+                table = self.clone_table(table)
+                tab_index += 1
+                self.tabWidget.insertTab(tab_index, table, f"{symbol} {expiry:%d%b}".upper())
+            model = OptionChainTableModel([], parent=table)
+            table.setModel(model)
+            self.chain_tables[(symbol, expiry)] = (table, model)
+
+    @staticmethod
+    def clone_table(template):
+        table = QtWidgets.QTableView()
+        table.setFont(template.font())
+        table.setStyleSheet(template.styleSheet())
+        table.setAlternatingRowColors(template.alternatingRowColors())
+        table.setSelectionMode(template.selectionMode())
+        table.setHorizontalScrollMode(template.horizontalScrollMode())
+        table.horizontalHeader().setDefaultSectionSize(template.horizontalHeader().defaultSectionSize())
+        table.horizontalHeader().setMinimumSectionSize(template.horizontalHeader().minimumSectionSize())
+        table.verticalHeader().setVisible(template.verticalHeader().isVisible())
+        return table
 
     def update_table_model(self, table_data):
-        #print(self.feedJson.get())
         self.index_table_model.update_data(table_data)
     
-    def update_option_table_model(self, model, table_data):
-        #print(self.feedJson.get())
-        model.update_data(table_data)
+    def update_option_table_model(self, symbol, expiry, table_data):
+        if (symbol, expiry) in self.chain_tables:
+            self.chain_tables[(symbol, expiry)][1].update_data(table_data)
+
+    def update_atm_strike(self, symbol, atm):
+        for (table_symbol, expiry), (table, model) in self.chain_tables.items():
+            if table_symbol == symbol:
+                model.set_highlight_value(atm)
+
+    def closeEvent(self, event):
+        if self.startup is not None:
+            self.startup.shutdown()
+        self.engine.stop()
+        super().closeEvent(event)
 
     def update_login_label(self, text):
         self.login_label.setText(text)  
            
-    def run_thread(self,thread_name, timeout=None):
-        if thread_name == 'login':
-            t = threading.Thread(target=self.ShoonyaLogin, daemon=True)
-            t.start()
-            t.join(timeout)
-        if thread_name == 'logout':
-            t = threading.Thread(target=self.ShoonyaLogout, daemon=True)
-            t.start()
-            t.join(timeout)
-
-    def static_token_initialize(self):
-        try:
-            tokens = []
-            for symbol, value in self.indices.items():
-                token = f"NSE|{value}"
-                tokens.append(token)
-            self.tokenlist.append(tokens)
-        except Exception as e:
-            print("Error static_token_initialize :: {}".format(e))
-    
-    def subscribe(self):
-        self.subscriber.update_newsublist(self.tokenlist.get())
-        
     def ShoonyaLogin(self):
+        websocket = self.startup.steps.get("websocket") if self.startup else None
+        if websocket is None or not websocket.done():
+            return
+        # retry only a failed startup or a socket that has since gone down (logout)
+        if websocket.exception() is None and self.api.websocket_connected():
+            return
         self.update_login_label("Please wait.")
-        with open('cred.yml') as f:
-            cred = yaml.load(f, Loader=yaml.FullLoader)
-
-        ret = self.api.login(userid=cred['user'],
-                        password=cred['pwd'],
-                        twoFA=pyotp.TOTP(cred['token']).now(),
-                        vendor_code=cred['vc'],
-                        api_secret=cred['apikey'],
-                        imei=cred['imei'])
-
-        if ret is not None:
-            #if ret['stat'] == 'Ok' :
-            self.update_login_label(f"Welcome {ret['uname'].title()}")
-            self.static_token_initialize()
-            self.wbhandler.start()
-            self.subscribe()
-        else:
-            self.update_login_label("Error :: Please Check Credentials")    
+        self.startup.connect()
+
+    def ShoonyaLogout(self):
+        if self.startup is not None:
+            self.startup.pool.submit(self.logout)
 
-    def ShoonyaLogout(self): 
-        if hasattr(self.api, '_NorenApi__username'):
-            self.api.close_websocket()
-            ret = self.api.logout()
+    def logout(self): 
+        if self.api.session_credentials() is not None:
+            ret = self.engine.logout()
             if ret is not None:
-                self.update_login_label("Logged Out") 
+                self.sink.on_status("Logged Out") 
             else:
-                self.update_login_label("Log Out Error")
+                self.sink.on_status("Log Out Error")
         else:
-            self.update_login_label("Please Login First")  
+            self.sink.on_status("Please Login First")  
 
 if __name__ == '__main__':
+    profile = StartupProfile()
+    profile.mark("imports")
     app = QtWidgets.QApplication(sys.argv)
-    window = OCStreamer()
+    profile.mark("QApplication")
+    record_dir = sys.argv[sys.argv.index("--record") + 1] if "--record" in sys.argv else None
+    window = OCStreamer(profile, record_dir)
     window.show()
+    app.processEvents()
+    profile.mark("first paint")
+    QtCore.QTimer.singleShot(0, window.start_engine)
+    if "--profile-startup" in sys.argv:
+        def report_when_started():
+            if window.startup is not None and window.startup.wait(0):
+                timer.stop()
+                profile.report()
+                app.quit()
+        timer = QtCore.QTimer()
+        timer.timeout.connect(report_when_started)
+        timer.start(20)
     app.exec_()
\ No newline at end of file
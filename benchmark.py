@@ -0,0 +1,1220 @@
+import argparse
+import io
+import os
+import tempfile
+import threading
+import time
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+import sys
+
+from shared import SharedDict, TickArray, TICK_FIELDS
+from symbolsearch import SearchScrip, InstrumentRegistry
+
+
+def make_nfo_master(symbols=("NIFTY", "BANKNIFTY", "FINNIFTY"), expiries=8, strikes=2000):
+    '''Synthetic NFO master shaped like NFO_symbols.txt, roughly 100k rows with the defaults.'''
+    rows = []
+    token = 35000
+    start = date.today()
+    for symbol, base, diff in zip(symbols, (19000, 44000, 19500), (50, 100, 50)):
+        for e in range(expiries):
+            expiry = (start + timedelta(days=7 * e)).strftime('%d-%b-%Y').upper()
+            for i in range(strikes):
+                strike = float(base + (i - strikes // 2) * diff)
+                for opt in ("CE", "PE"):
+                    rows.append(("NFO", token, 50, symbol,
+                                 f"{symbol}{expiry[:2]}{expiry[3:6]}{expiry[-2:]}{opt[0]}{int(strike)}",
+                                 expiry, "OPTIDX", opt, strike, 0.05))
+                    token += 1
+    return pd.DataFrame(rows, columns=["Exchange", "Token", "LotSize", "Symbol", "TradingSymbol",
+                                       "Expiry", "Instrument", "OptionType", "StrikePrice", "TickSize"])
+
+
+def make_searchscrip(df):
+    sc = SearchScrip()
+    sc.exch_list = ["NFO"]
+    sc.symbol_cache["NFO"] = df
+    return sc
+
+
+def chain_lookups(symbol, expiry, atm, diff, no_of_strikes=10):
+    strikes = [atm + i * diff for i in range(-no_of_strikes, no_of_strikes + 1)]
+    return [{"symbol": symbol, "expiry": expiry, "strikeprice": strike, "optiontype": opt}
+            for opt in ("CE", "PE") for strike in strikes]
+
+
+def bench_registry(repeat=3):
+    df = make_nfo_master()
+    sc = make_searchscrip(df)
+    expiry = pd.to_datetime(df['Expiry'].iloc[0], format='%d-%b-%Y').date()
+    lookups = chain_lookups("BANKNIFTY", expiry, 44000.0, 100)
+    print(f"NFO master rows :: {len(df)} :: lookups per recenter :: {len(lookups)}")
+
+    t0 = time.perf_counter()
+    registry = InstrumentRegistry(df)
+    print(f"registry build      :: {(time.perf_counter() - t0) * 1000:9.2f} ms")
+    sc.registry["NFO"] = registry
+
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        query_result = [tuple(sc.query_scrip(**kw)) for kw in lookups]
+    query_ms = (time.perf_counter() - t0) * 1000 / repeat
+    print(f"query path recenter :: {query_ms:9.2f} ms")
+
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        registry_result = [tuple(sc.search_scrip(**kw)) for kw in lookups]
+    registry_ms = (time.perf_counter() - t0) * 1000 / repeat
+    print(f"registry recenter   :: {registry_ms:9.2f} ms  ({query_ms / registry_ms:.0f}x)")
+    assert [str(t) for _, t in query_result] == [str(t) for _, t in registry_result]
+
+
+def bench_ladder(repeat=200):
+    df = make_nfo_master()
+    expiry = pd.to_datetime(df['Expiry'].iloc[0], format='%d-%b-%Y').date()
+    with tempfile.TemporaryDirectory() as tmp:
+        sc = make_searchscrip(df)
+        sc.l_path = tmp
+        sc.registry["NFO"] = InstrumentRegistry(df)
+
+        t0 = time.perf_counter()
+        ladder = sc.get_strike_ladder(symbol="BANKNIFTY", expiry=expiry)
+        print(f"ladder build        :: {(time.perf_counter() - t0) * 1000:9.2f} ms  ({len(ladder)} strikes)")
+        restarted = make_searchscrip(df)
+        restarted.l_path = tmp
+        t0 = time.perf_counter()
+        restarted.get_strike_ladder(symbol="BANKNIFTY", expiry=expiry)
+        print(f"ladder, same day    :: {(time.perf_counter() - t0) * 1000:9.2f} ms")
+
+        t0 = time.perf_counter()
+        for i in range(repeat):
+            lookup = [tuple(sc.search_scrip(**kw)) for kw in chain_lookups("BANKNIFTY", expiry, 44000.0 + i % 5 * 100, 100)]
+        lookup_us = (time.perf_counter() - t0) * 1e6 / repeat
+        print(f"search_scrip window :: {lookup_us:9.1f} us")
+
+        t0 = time.perf_counter()
+        for i in range(repeat):
+            strikes, ce_tokens, pe_tokens = ladder.window(44000.0 + i % 5 * 100, 10)
+        window_us = (time.perf_counter() - t0) * 1e6 / repeat
+        print(f"ladder window       :: {window_us:9.1f} us  ({lookup_us / window_us:.0f}x)")
+        assert ce_tokens.tolist() + pe_tokens.tolist() == [str(token) for _, token in lookup]
+
+
+def bench_master_cache(repeat=3):
+    df = make_nfo_master()
+    with tempfile.TemporaryDirectory() as tmp:
+        sc = SearchScrip()
+        sc.l_path = tmp
+        csv_file = os.path.join(tmp, "NFO_symbols.csv")
+        df.to_csv(csv_file, index=None)
+        sc.save_columnar_cache(exch="NFO", df=df)
+
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            csv_df = pd.read_csv(csv_file, index_col=None)
+        csv_ms = (time.perf_counter() - t0) * 1000 / repeat
+        print(f"csv warm start      :: {csv_ms:9.2f} ms")
+
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            cache_df = sc.load_columnar_cache(exch="NFO")
+        cache_ms = (time.perf_counter() - t0) * 1000 / repeat
+        print(f"columnar warm start :: {cache_ms:9.2f} ms  ({csv_ms / cache_ms:.1f}x)")
+        pd.testing.assert_frame_equal(csv_df, cache_df, check_dtype=False)
+
+
+class MasterStandIn(BaseHTTPRequestHandler):
+    '''Local stand-in for the Shoonya symbol master mirrors, honouring If-None-Match.'''
+    protocol_version = "HTTP/1.1"
+    payloads = {}
+    latency = 0.2
+    served = {"200": 0, "304": 0, "bytes": 0}
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        name = self.path.strip("/")
+        if name not in self.payloads:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body, etag = self.payloads[name]
+        if self.headers.get("If-None-Match") == etag:
+            self.served["304"] += 1
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.served["200"] += 1
+        self.served["bytes"] += len(body)
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def zip_master(df, name):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr(name, df.to_csv(index=None))
+    return buf.getvalue()
+
+
+def bench_download():
+    nfo = make_nfo_master()
+    nse = nfo.drop(columns=["Expiry", "OptionType", "StrikePrice"]).head(3000).assign(Exchange="NSE", Instrument="EQ")
+    MasterStandIn.payloads = {
+        "NFO_symbols.txt.zip": (zip_master(nfo, "NFO_symbols.txt"), '"nfo-1"'),
+        "NSE_symbols.txt.zip": (zip_master(nse, "NSE_symbols.txt"), '"nse-1"'),
+    }
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MasterStandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            sc = SearchScrip()
+            sc.l_path = tmp
+            sc.config_file = os.path.join(tmp, "search_config.json")
+            sc.master_urls = (f"http://127.0.0.1:{server.server_port}/{{exch}}_symbols.txt.zip",)
+
+            t0 = time.perf_counter()
+            sc.initialize_symbols(exch_list=["NSE", "NFO"], hard_refresh=True)
+            print(f"cold, concurrent    :: {(time.perf_counter() - t0) * 1000:9.2f} ms  {MasterStandIn.served}")
+
+            t0 = time.perf_counter()
+            sc.initialize_symbols(exch_list=["NSE", "NFO"], hard_refresh=True)
+            print(f"refresh, validated  :: {(time.perf_counter() - t0) * 1000:9.2f} ms  {MasterStandIn.served}")
+            assert len(sc.get_symbols("NFO")) == len(nfo)
+            sc.close()
+        finally:
+            os.chdir(cwd)
+            server.shutdown()
+
+
+def make_tick(token, i):
+    price = f"{100 + i % 50}.05"
+    return {"t": "tf", "e": "NFO", "tk": token, "lp": price, "c": price, "v": str(i), "oi": str(i)}
+
+
+def run_ingest(store, tokens, readers, duration=1.0, reader_fps=None):
+    '''Writer thread ingests ticks while reader threads walk snapshots and check that every
+    tick dict is internally consistent (lp == c is written atomically per tick). Readers
+    spin unless reader_fps paces them like the table fetchers.'''
+    stop = threading.Event()
+    counts = {"writes": 0, "reads": 0, "torn": 0}
+
+    def writer():
+        i = 0
+        while not stop.is_set():
+            token = tokens[i % len(tokens)]
+            store.write(token, make_tick(token, i))
+            i += 1
+        counts["writes"] = i
+
+    def reader():
+        reads = torn = 0
+        while not stop.is_set():
+            for tick in store.snapshot().values():
+                if tick.get("lp") != tick.get("c"):
+                    torn += 1
+            reads += 1
+            if reader_fps:
+                time.sleep(1 / reader_fps)
+        counts["reads"] += reads
+        counts["torn"] += torn
+
+    threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader) for _ in range(readers)]
+    for t in threads:
+        t.start()
+    time.sleep(duration)
+    stop.set()
+    for t in threads:
+        t.join()
+    return {k: v / duration if k != "torn" else v for k, v in counts.items()}
+
+
+def bench_tickstore(duration=1.0):
+    tokens = [str(35000 + i) for i in range(63)] + ["26000", "26009", "26037", "26017"]
+    for reader_fps in (None, 10):
+        pace = f"{reader_fps} fps" if reader_fps else "spinning"
+        for readers in (0, 3, 6):
+            result = run_ingest(SharedDict(), tokens, readers, duration, reader_fps)
+            print(f"{readers} readers, {pace:8s} :: ingest {result['writes']:10,.0f} ticks/s :: "
+                  f"snapshots {result['reads']:9,.0f}/s :: torn {result['torn']}")
+
+
+def make_chain(no_of_strikes=10, atm=44000.0, diff=100):
+    strikes = [atm + i * diff for i in range(-no_of_strikes, no_of_strikes + 1)]
+    return {strike: [{"optiontype": "CE", "token": str(40000 + i)}, {"optiontype": "PE", "token": str(50000 + i)}]
+            for i, strike in enumerate(strikes)}
+
+
+def full_tick(token, i):
+    tick = make_tick(token, i)
+    tick.update({field: tick["lp"] for field in ("o", "h", "l", "bp1", "sp1")})
+    tick.update({"poi": "100", "bq1": "50", "sq1": "75", "ts": f"BANKNIFTY{token}"})
+    return tick
+
+
+def dict_chain_rows(data, token_dict):
+    '''The per-strike dict lookup and float() parsing the fetcher did before TickArray.'''
+    rows = []
+    for strike in sorted(token_dict):
+        ce, pe = data.get(token_dict[strike][0]["token"], {}), data.get(token_dict[strike][1]["token"], {})
+        ce_change = round(float(ce["lp"]) - float(ce["c"]), 2) if ce.get("lp") and ce.get("c") else None
+        pe_change = round(float(pe["lp"]) - float(pe["c"]), 2) if pe.get("lp") and pe.get("c") else None
+        rows.append([ce.get("l", ""), ce.get("h", ""), ce.get("o", ""), ce.get("v", ""), ce.get("oi", ""),
+                     ce.get("poi", ""), ce_change, ce.get("lp", ""), strike, pe.get("lp", ""), pe_change,
+                     pe.get("poi", ""), pe.get("oi", ""), pe.get("v", ""), pe.get("o", ""), pe.get("h", ""),
+                     pe.get("l", "")])
+    return rows
+
+
+def bench_chain_read(repeat=2000):
+    from utils import OptionChainDataFetcher
+
+    token_dict = make_chain()
+    store = SharedDict(ticks=TickArray())
+    fetcher = OptionChainDataFetcher(store)
+    fetcher.process_token_dict(token_dict)
+    for i, (ce, pe) in enumerate(token_dict.values()):
+        store.write(ce["token"], full_tick(ce["token"], i))
+        store.write(pe["token"], full_tick(pe["token"], i))
+
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        dict_chain_rows(store.snapshot(), token_dict)
+    dict_us = (time.perf_counter() - t0) * 1e6 / repeat
+    t0 = time.perf_counter()
+    strikes, ce_slots, pe_slots, _ = fetcher.chain
+    for _ in range(repeat):
+        fetcher.build_rows(strikes, ce_slots, pe_slots)
+    array_us = (time.perf_counter() - t0) * 1e6 / repeat
+    print(f"dict full build      :: {dict_us:9.1f} us")
+    print(f"array full build     :: {array_us:9.1f} us")
+
+    tick = store.read(token_dict[44000.0][0]["token"])
+    dict_bytes = sys.getsizeof(tick) + sum(sys.getsizeof(tick[field]) for field in TICK_FIELDS if field in tick)
+    print(f"numeric fields per token :: dict {dict_bytes} B :: array {store.ticks.ticks.dtype.itemsize} B")
+
+
+def bench_change_set(cycles=500):
+    '''Per-cycle fetcher cost against the number of chain ticks that arrived since the last cycle.'''
+    from utils import OptionChainDataFetcher
+
+    token_dict = make_chain()
+    tokens = [option["token"] for options in token_dict.values() for option in options]
+    store = SharedDict(ticks=TickArray())
+    fetcher = OptionChainDataFetcher(store)
+    fetcher.process_token_dict(token_dict)
+    rng = np.random.default_rng(7)
+    for ticks_per_cycle in (0, 1, 5, 20, 42, 200):
+        fetcher.get_table_data()
+        elapsed = 0.0
+        for cycle in range(cycles):
+            for token in rng.choice(tokens, ticks_per_cycle):
+                store.write(token, full_tick(token, cycle))
+            t0 = time.perf_counter()
+            fetcher.get_table_data()
+            elapsed += time.perf_counter() - t0
+        print(f"{ticks_per_cycle:4d} ticks/cycle :: {elapsed * 1e6 / cycles:8.1f} us/cycle")
+
+
+def offscreen_app():
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5 import QtWidgets
+    return QtWidgets.QApplication.instance() or QtWidgets.QApplication(sys.argv)
+
+
+def chain_tables(cycles, changes_per_cycle, seed=11):
+    '''Successive fetcher tables over one strike set with a few ticking rows per cycle.'''
+    from utils import OptionChainDataFetcher
+
+    token_dict = make_chain()
+    tokens = [option["token"] for options in token_dict.values() for option in options]
+    store = SharedDict(ticks=TickArray())
+    fetcher = OptionChainDataFetcher(store)
+    fetcher.process_token_dict(token_dict)
+    for i, token in enumerate(tokens):
+        store.write(token, full_tick(token, i))
+    tables = [fetcher.get_table_data()]
+    rng = np.random.default_rng(seed)
+    for cycle in range(cycles):
+        for token in rng.choice(tokens, changes_per_cycle):
+            tick = {"tk": token, "lp": f"{rng.uniform(50, 150):.2f}", "v": str(cycle * 100)}
+            if cycle % 5 == 0:
+                tick["oi"] = str(cycle * 10)
+            store.write(token, tick)
+        tables.append(fetcher.get_table_data() or tables[-1])
+    return tables
+
+
+def paint_cycles(model, view, tables, app, reset):
+    calls = {"data": 0}
+    data = model.data
+
+    def counting_data(index, role=0):
+        calls["data"] += 1
+        return data(index, role)
+
+    model.data = counting_data
+    t0 = time.perf_counter()
+    for table in tables:
+        if reset:
+            model.beginResetModel()
+            model._data = table
+            model.endResetModel()
+        else:
+            model.update_data(table)
+        app.processEvents()
+    elapsed = (time.perf_counter() - t0) * 1000 / len(tables)
+    model.data = data
+    return elapsed, calls["data"] / len(tables)
+
+
+def bench_model_update(cycles=100):
+    from PyQt5 import QtWidgets
+    from models import OptionChainTableModel
+
+    app = offscreen_app()
+    for changes in (2, 10, 42):
+        tables = chain_tables(cycles, changes)
+        for reset in (True, False):
+            view = QtWidgets.QTableView()
+            model = OptionChainTableModel([], parent=view)
+            view.setModel(model)
+            view.resize(1600, 900)
+            view.show()
+            model.update_data(tables[0])
+            app.processEvents()
+            elapsed, calls = paint_cycles(model, view, tables[1:], app, reset)
+            label = "reset      " if reset else "incremental"
+            print(f"{changes:3d} ticks/cycle :: {label} :: {elapsed:7.2f} ms/cycle :: {calls:7.0f} data() calls/cycle")
+            view.close()
+
+
+def bench_paint(repeat=50):
+    '''Full repaint of a 21 strike chain and the cost of one BackgroundRole lookup.'''
+    from PyQt5 import QtWidgets
+    from PyQt5.QtCore import Qt
+    from models import OptionChainTableModel
+
+    app = offscreen_app()
+    table = chain_tables(0, 0)[0]
+    view = QtWidgets.QTableView()
+    model = OptionChainTableModel([], parent=view)
+    view.setModel(model)
+    view.resize(1600, 900)
+    view.show()
+    model.update_data(table)
+    model.set_highlight_value(table[len(table) // 2][model.strikes_index])
+    app.processEvents()
+
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        view.viewport().repaint()
+    print(f"full repaint        :: {(time.perf_counter() - t0) * 1000 / repeat:8.2f} ms")
+
+    indexes = [model.index(row, column) for row in range(model.rowCount()) for column in range(model.columnCount())]
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for index in indexes:
+            model.data(index, Qt.BackgroundRole)
+    print(f"BackgroundRole call :: {(time.perf_counter() - t0) * 1e6 / (repeat * len(indexes)):8.2f} us")
+    view.close()
+
+
+def bench_refresh(ticks=60, max_fps=10):
+    '''Tick-to-frame latency and idle CPU of the event-driven OptionChainDataFetcher.'''
+    from utils import OptionChainDataFetcher
+
+    token_dict = make_chain()
+    tokens = [option["token"] for options in token_dict.values() for option in options]
+    store = SharedDict(ticks=TickArray())
+    fetcher = OptionChainDataFetcher(store, 1000 // max_fps)
+    frames = []
+    fetcher.table_data_ready.connect(lambda table: frames.append(time.perf_counter()))
+    fetcher.process_token_dict(token_dict)
+    fetcher.start()
+    time.sleep(0.2)
+
+    rng = np.random.default_rng(3)
+    latencies = []
+    for i in range(ticks):
+        time.sleep(rng.uniform(0.05, 0.3))
+        seen = len(frames)
+        sent = time.perf_counter()
+        token = tokens[i % len(tokens)]
+        store.write(token, full_tick(token, i))
+        while len(frames) == seen and time.perf_counter() - sent < 1:
+            time.sleep(0.0005)
+        latencies.append((frames[-1] - sent) * 1000)
+
+    idle_frames = len(frames)
+    cpu = time.process_time()
+    time.sleep(1)
+    idle_cpu = (time.process_time() - cpu) * 1000
+    fetcher.stop()
+    fetcher.join()
+    latencies.sort()
+    print(f"max {max_fps} fps :: tick-to-frame p50 {latencies[len(latencies) // 2]:6.2f} ms :: "
+          f"p95 {latencies[int(len(latencies) * 0.95)]:6.2f} ms")
+    print(f"idle 1 s :: {len(frames) - idle_frames} frames :: {idle_cpu:.1f} ms CPU (incl. this sleeping thread)")
+
+
+def bench_ingest(frames=200000, readers=3):
+    '''Receive-thread cost per frame: applying to SharedDict inline versus handing the frame
+    to FeedApplier, with readers contending for the store lock.'''
+    from socket_utils import FeedApplier
+
+    tokens = [str(35000 + i) for i in range(130)]
+    messages = [make_tick(tokens[i % len(tokens)], i) for i in range(frames)]
+
+    def with_readers(store, receive):
+        stop = threading.Event()
+
+        def reader():
+            while not stop.is_set():
+                with store.lock:
+                    dict(store.feedJson)
+
+        threads = [threading.Thread(target=reader) for _ in range(readers)]
+        for t in threads:
+            t.start()
+        t0 = time.perf_counter()
+        receive()
+        elapsed = time.perf_counter() - t0
+        stop.set()
+        for t in threads:
+            t.join()
+        return elapsed
+
+    store = SharedDict(ticks=TickArray())
+    store.ticks.intern(tokens)
+    elapsed = with_readers(store, lambda: [store.write(m["tk"], m) for m in messages])
+    print(f"inline apply :: {elapsed * 1e6 / frames:6.2f} us/frame on the receive thread")
+
+    store = SharedDict(ticks=TickArray())
+    store.ticks.intern(tokens)
+    applier = FeedApplier(store)
+    applier.start()
+
+    def receive():
+        for m in messages:
+            applier.put(m)
+
+    elapsed = with_readers(store, receive)
+    while applier.applied + applier.coalesced < applier.received:
+        time.sleep(0.01)
+    applier.stop()
+    applier.join()
+    print(f"FeedApplier  :: {elapsed * 1e6 / frames:6.2f} us/frame on the receive thread :: {applier.stats()}")
+
+    # partial frames (one field each) through a ring far too small: the overflow map must
+    # leave the store exactly where applying every frame in order would
+    rng = np.random.default_rng(5)
+    fields = rng.choice(TICK_FIELDS, frames).tolist()
+    partials = [{"t": "tf", "tk": tokens[i % len(tokens)], field: str(i)} for i, field in enumerate(fields)]
+    expected = {}
+    for m in partials:
+        expected[m["tk"]] = {**expected.get(m["tk"], {}), **m}
+    store = SharedDict()
+    applier = FeedApplier(store, capacity=1024)
+    applier.start()
+    elapsed = with_readers(store, lambda: [applier.put(m) for m in partials])
+    while applier.applied + applier.coalesced < applier.received:
+        time.sleep(0.01)
+    applier.stop()
+    applier.join()
+    assert dict(store.feedJson) == expected
+    print(f"ring of 1024 :: {elapsed * 1e6 / frames:6.2f} us/frame :: overflowed={applier.overflowed} "
+          f"applied={applier.applied} :: final store matches in-order apply")
+
+
+TOUCHLINE_ACK = ('{"t":"tk","e":"NFO","tk":"%s","ts":"BANKNIFTY26OCT23C44000","pp":"2","ls":"15","ti":"0.05",'
+                 '"lp":"312.45","pc":"-4.12","c":"325.85","o":"330.00","h":"345.10","l":"290.25","ap":"315.32",'
+                 '"v":"1843215","oi":"512340","poi":"498210","bq1":"45","bp1":"312.40","sq1":"30","sp1":"312.50"}')
+TOUCHLINE = '{"t":"tf","e":"NFO","tk":"%s","lp":"%s","pc":"-4.10","ft":"1697612345","v":"1843260","bp1":"312.45","sp1":"312.55"}'
+DEPTH = ('{"t":"df","e":"NFO","tk":"%s","lp":"%s","ft":"1697612345","v":"1843275","ltq":"15","ltt":"12:49:05",'
+         '"bp1":"312.45","bp2":"312.40","bp3":"312.35","bp4":"312.30","bp5":"312.25",'
+         '"sp1":"312.55","sp2":"312.60","sp3":"312.65","sp4":"312.70","sp5":"312.75",'
+         '"bq1":"60","bq2":"45","bq3":"90","bq4":"30","bq5":"120","sq1":"15","sq2":"75","sq3":"30","sq4":"45","sq5":"60",'
+         '"bo1":"2","bo2":"1","bo3":"3","bo4":"1","bo5":"4","so1":"1","so2":"2","so3":"1","so4":"2","so5":"3","tbq":"98715","tsq":"112340"}')
+
+
+def make_frames(count, tokens, depth_share=0.5, seed=5):
+    '''Shoonya-shaped raw feed frames: one tk ack per token, then touchline/depth updates.'''
+    rng = np.random.default_rng(seed)
+    frames = [TOUCHLINE_ACK % token for token in tokens]
+    for i in range(count):
+        token = tokens[i % len(tokens)]
+        price = f"{rng.uniform(50, 500):.2f}"
+        frames.append((DEPTH if rng.random() < depth_share else TOUCHLINE) % (token, price))
+    return frames
+
+
+def bench_decode(count=200000):
+    import json
+    import Noren
+
+    frames = make_frames(count, [str(35000 + i) for i in range(63)])
+    decoders = [("json.loads", json.loads)]
+    if Noren.decode_frame is not json.loads:
+        decoders.append(("orjson", Noren.decode_frame))
+    for name, decoder in decoders:
+        api = Noren.NorenApi(host="http://localhost/", websocket="ws://localhost/", decoder=decoder)
+        received = []
+        api._NorenApi__subscribe_callback = received.append
+        api._NorenApi__build_dispatch()
+        on_data = api._NorenApi__on_data_callback
+        t0 = time.perf_counter()
+        for frame in frames:
+            on_data(None, frame)
+        elapsed = time.perf_counter() - t0
+        assert len(received) == len(frames)
+        print(f"{name:10s} :: {len(frames) / elapsed:12,.0f} frames/s")
+
+
+def bench_recorder(count=200000, max_bytes=8 * 1024 * 1024, rate=5000, seconds=2):
+    '''Cost of FrameRecorder on the socket thread, flat out and at rate frames/s (the
+    per-frame on_data time, percentiles), and reading the session back via mmap.'''
+    import Noren
+    from recorder import FrameRecorder, read_session
+
+    frames = make_frames(count, [str(35000 + i) for i in range(63)])
+    with tempfile.TemporaryDirectory() as tmp:
+        for recording in (False, True):
+            label = "recording" if recording else "plain    "
+            recorder = FrameRecorder(tmp, session=f"paced-{recording}") if recording else None
+            api = Noren.NorenApi(host="http://localhost/", websocket="ws://localhost/", recorder=recorder)
+            api._NorenApi__subscribe_callback = lambda message: None
+            api._NorenApi__build_dispatch()
+            on_data = api._NorenApi__on_data_callback
+            if recorder is not None:
+                recorder.start()
+            costs = []
+            interval = 1 / rate
+            next_frame = time.perf_counter()
+            for frame in frames[:rate * seconds]:
+                while time.perf_counter() < next_frame:
+                    pass
+                t0 = time.perf_counter()
+                on_data(None, frame)
+                costs.append((time.perf_counter() - t0) * 1e6)
+                next_frame += interval
+            p50, p99, p999 = np.percentile(costs, [50, 99, 99.9])
+            print(f"{label} :: {rate}/s :: on_data p50 {p50:5.1f} us :: p99 {p99:5.1f} us :: p99.9 {p999:6.1f} us")
+            if recorder is not None:
+                recorder.stop()
+                recorder.join()
+
+        for recording in (False, True):
+            recorder = FrameRecorder(tmp, session="bench", max_bytes=max_bytes) if recording else None
+            api = Noren.NorenApi(host="http://localhost/", websocket="ws://localhost/", recorder=recorder)
+            api._NorenApi__subscribe_callback = lambda message: None
+            api._NorenApi__build_dispatch()
+            on_data = api._NorenApi__on_data_callback
+            if recorder is not None:
+                recorder.start()
+            t0 = time.perf_counter()
+            for frame in frames:
+                on_data(None, frame)
+            elapsed = time.perf_counter() - t0
+            label = "recording" if recording else "plain    "
+            print(f"{label} :: flat out :: {elapsed * 1e9 / len(frames):7.0f} ns/frame on the socket thread")
+            if recorder is not None:
+                recorder.stop()
+                recorder.join()
+                print(f"written   :: {recorder.stats()}")
+                t0 = time.perf_counter()
+                read = [(received, bytes(frame)) for received, frame in read_session(recorder.path)]
+                elapsed = time.perf_counter() - t0
+                assert [frame.decode() for _, frame in read] == frames
+                assert all(a[0] <= b[0] for a, b in zip(read, read[1:]))
+                print(f"read back :: {len(read) / elapsed:12,.0f} frames/s, identical and in order")
+
+
+def record_session(directory, frames, times_ns):
+    '''Writes frames with the given receive times as a FrameRecorder session.'''
+    from recorder import FrameRecorder
+
+    recorder = FrameRecorder(directory, session="replay")
+    recorder.pending.extend(zip(times_ns, frames))
+    recorder.start()
+    recorder.stop()
+    recorder.join()
+    return recorder.path
+
+
+def spike_session(base_rate=200, spike_rate=5000, seed=13):
+    '''Receive times of 2 s at base_rate, a 1 s spike at spike_rate and 1 s at base_rate.'''
+    rng = np.random.default_rng(seed)
+    times, t = [], 0.0
+    for rate, seconds in ((base_rate, 2), (spike_rate, 1), (base_rate, 1)):
+        end = t + seconds
+        while True:
+            t += rng.exponential(1 / rate)
+            if t >= end:
+                t = end
+                break
+            times.append(int(t * 1e9))
+    return times
+
+
+def replay_pipeline(path, speed, decode):
+    '''ReplayApi -> WebSocketHandler -> FeedApplier -> SharedDict -> OptionChainDataFetcher
+    -> OptionChainTableModel, run until the session ends and the last frame is applied.'''
+    from replay import ReplayApi
+    from shared import SharedList
+    from socket_utils import WebSocketHandler
+    from utils import OptionChainDataFetcher
+    from models import OptionChainTableModel
+
+    api = ReplayApi(path, speed=speed, decode=decode)
+    store = SharedDict(ticks=TickArray())
+    fetcher = OptionChainDataFetcher(store, 100)
+    model = OptionChainTableModel([])
+    frames = []
+    fetcher.table_data_ready.connect(lambda table: (model.update_data(table), frames.append(time.perf_counter())))
+    fetcher.process_token_dict(make_chain())
+    fetcher.start()
+    handler = WebSocketHandler(SharedList(), store, SharedDict(), recording_subscriber(), api)
+    handler.start()
+    t0 = time.perf_counter()
+    api.finished.wait()
+    while handler.applier.queue or handler.applier.applied + handler.applier.coalesced < handler.applier.received:
+        time.sleep(0.001)
+    # handler.start() returns on socket open, after a decode='ahead' replay has decoded
+    elapsed = time.perf_counter() - t0
+    time.sleep(0.15)
+    fetcher.stop()
+    fetcher.join()
+    handler.applier.stop()
+    return api, handler.applier, [t - t0 for t in frames], elapsed, store.ticks.read(fetcher.chain[1]).tolist()
+
+
+def bench_replay(count=100000):
+    '''Recorded sessions played back through the feed pipeline: count frames at max speed,
+    then a session with a tick-rate spike at its recorded timing, twice.'''
+    tokens = [option["token"] for options in make_chain().values() for option in options]
+    with tempfile.TemporaryDirectory() as tmp:
+        frames = make_frames(count, tokens)
+        path = record_session(os.path.join(tmp, "flat"), frames, range(len(frames)))
+        for decode in ("live", "ahead"):
+            api, applier, _, elapsed, _ = replay_pipeline(path, None, decode)
+            print(f"max speed, decode {decode:5s} :: {len(frames) / elapsed:9,.0f} frames/s  "
+                  f"applied={applier.applied} coalesced={applier.coalesced} max_depth={applier.max_depth}")
+
+        times = spike_session()
+        frames = make_frames(len(times) - len(tokens), tokens)
+        path = record_session(os.path.join(tmp, "spike"), frames, times)
+
+        finals = []
+        for run in range(2):
+            api, applier, frame_times, elapsed, final = replay_pipeline(path, 1.0, "live")
+            finals.append(final)
+            phases = np.histogram(frame_times, bins=[0, 2, 3, 4, np.inf])[0]
+            print(f"1x run {run + 1} :: {elapsed:5.2f} s for 4 s recorded :: max lag {api.max_lag * 1000:5.2f} ms :: "
+                  f"table frames per phase (base, spike, base) {phases[:3].tolist()}")
+        print(f"final chain identical across runs :: {finals[0] == finals[1]}")
+
+        # the whole engine on a replay: recenters must not send any REST request
+        print(f"engine replay, host lookups :: {engine_replay_lookups(path, make_nfo_master(), tmp)}")
+
+
+def engine_replay_lookups(path, df, tmp):
+    '''Host name lookups (every HTTP request starts with one) made while a StreamingEngine
+    plays back path with a chain that recenters.'''
+    import socket
+    from engine import StreamingEngine
+    from replay import ReplayApi
+
+    lookups = []
+    getaddrinfo = socket.getaddrinfo
+    socket.getaddrinfo = lambda host, *args, **kwargs: lookups.append(host) or getaddrinfo(host, *args, **kwargs)
+    try:
+        engine = StreamingEngine(api=ReplayApi(path, speed=None), symbols=("BANKNIFTY",), expiries=("current",))
+        engine.sc = make_searchscrip(df)
+        engine.sc.l_path = tmp
+        engine.build()
+        engine.login()
+        engine.start_feed()
+        for ltp in ("44000", "44500", "45000"):
+            engine.feedJson.write(engine.indices["banknifty"], {"ts": "Nifty Bank", "lp": ltp})
+            time.sleep(0.3)
+        engine.api.finished.wait(10)
+        engine.stop()
+    finally:
+        socket.getaddrinfo = getaddrinfo
+    assert engine.bootstrap is None and not lookups, lookups
+    return len(lookups)
+
+
+class RestStandIn(BaseHTTPRequestHandler):
+    '''Local stand-in for the Noren REST host: answers every POST with a small quote.'''
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    body = b'{"stat":"Ok","exch":"NFO","token":"35001","lp":"101.05","c":"99.00"}'
+    connections = 0
+    latency = 0.0
+    jkeys = set()
+
+    def setup(self):
+        super().setup()
+        RestStandIn.connections += 1
+
+    def do_POST(self):
+        payload = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        RestStandIn.jkeys.add(payload.rpartition(b"&jKey=")[2].decode())
+        time.sleep(self.latency)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+def bench_rest(calls=500):
+    import requests
+    import Noren
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RestStandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host = f"http://127.0.0.1:{server.server_port}"
+    try:
+        class OneShot:
+            '''The old behaviour: a fresh connection for every request.'''
+            def post(self, url, data=None, headers=None):
+                return requests.post(url, data=data, headers=headers)
+
+        for name, session in (("requests.post", OneShot()), ("RestSession", Noren.RestSession())):
+            api = Noren.NorenApi(host=host, websocket="ws://localhost/", session=session)
+            api.set_session("BENCH", "", "token")
+            RestStandIn.connections = 0
+            t0 = time.perf_counter()
+            for i in range(calls):
+                assert api.get_quotes("NFO", str(35000 + i % 63))["lp"] == "101.05"
+            elapsed_ms = (time.perf_counter() - t0) * 1000
+            print(f"{name:14s} :: {elapsed_ms / calls:7.3f} ms/call  connections={RestStandIn.connections}")
+        print(f"route metrics  :: {session.latency()['/GetQuotes']}")
+        session.close()
+    finally:
+        server.shutdown()
+
+
+def bench_fanout(tokens=63, latency=0.02):
+    import asyncio
+    import Noren
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RestStandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host = f"http://127.0.0.1:{server.server_port}"
+    RestStandIn.latency = latency
+    chain = [str(35000 + i) for i in range(tokens)]
+    try:
+        api = Noren.NorenApi(host=host, websocket="ws://localhost/")
+        api.set_session("BENCH", "", "token")
+        t0 = time.perf_counter()
+        quotes = [api.get_quotes("NFO", token) for token in chain]
+        serial_ms = (time.perf_counter() - t0) * 1000
+        print(f"get_quotes x{tokens}      :: {serial_ms:9.2f} ms")
+
+        async def fan_out(concurrency):
+            client = Noren.AsyncNorenApi.from_api(api, concurrency=concurrency)
+            t0 = time.perf_counter()
+            many = await client.get_quotes_many("NFO", chain)
+            elapsed_ms = (time.perf_counter() - t0) * 1000
+            await client.close()
+            assert len(many) == len(quotes)
+            return elapsed_ms
+
+        for concurrency in (8, 32, 64):
+            elapsed_ms = asyncio.run(fan_out(concurrency))
+            print(f"get_quotes_many c={concurrency:<3d} :: {elapsed_ms:9.2f} ms  ({serial_ms / elapsed_ms:.1f}x)")
+    finally:
+        RestStandIn.latency = 0.0
+        server.shutdown()
+
+
+def bench_bootstrap(strikes=21, latency=0.02):
+    import Noren
+    from socket_utils import QuoteBootstrap
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RestStandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    RestStandIn.latency = latency
+    try:
+        api = Noren.NorenApi(host=f"http://127.0.0.1:{server.server_port}", websocket="ws://localhost/")
+        api.set_session("BENCH", "", "token")
+        store = SharedDict(ticks=TickArray())
+        keys = [f"NFO|{35000 + i}" for i in range(2 * strikes)]
+        store.ticks.intern(keys)
+        # one strike has already ticked on the websocket; its lp must survive the seed
+        store.write("35000", {"tk": "35000", "lp": "999.00"})
+
+        bootstrap = QuoteBootstrap(store, api)
+        bootstrap.start()
+        t0 = time.perf_counter()
+        bootstrap.put(keys)
+        while bootstrap.requested + bootstrap.skipped < len(keys):
+            time.sleep(0.001)
+        elapsed_ms = (time.perf_counter() - t0) * 1000
+
+        filled = sum(store.ticks.value(key, "lp") is not None for key in keys)
+        assert store.ticks.value("35000", "lp") == 999.0
+        print(f"seeded {filled}/{len(keys)} rows in {elapsed_ms:7.2f} ms  {bootstrap.stats()}")
+        print(f"one serial round-trip each would take >= {len(keys) * latency * 1000:.0f} ms")
+
+        # relogin, then resubscribe two strikes: the one that went quiet is seeded again
+        # (its stale lp replaced) with the new token, the one still ticking is skipped
+        api.set_session("BENCH", "", "relogin")
+        RestStandIn.jkeys.clear()
+        store.write("35000", {"tk": "35000", "lp": "999.00"})
+        store.write("35001", {"tk": "35001", "lp": "1.00"})
+        store.stamps["35001"] -= bootstrap.stale_after + 1
+        done = bootstrap.requested + bootstrap.skipped + 2
+        bootstrap.put(["NFO|35000", "NFO|35001"])
+        while bootstrap.requested + bootstrap.skipped < done:
+            time.sleep(0.001)
+        bootstrap.stop()
+        assert store.ticks.value("35001", "lp") == 101.05 and store.ticks.value("35000", "lp") == 999.0
+        assert RestStandIn.jkeys == {"relogin"}
+        print(f"resubscribe :: {bootstrap.stats()} :: jKey sent {sorted(RestStandIn.jkeys)}")
+    finally:
+        RestStandIn.latency = 0.0
+        server.shutdown()
+
+
+class FeedRecorder:
+    '''Stands in for NorenApi on the subscription side and counts what would be sent.'''
+    def __init__(self):
+        self.frames = {"subscribe": 0, "unsubscribe": 0}
+        self.tokens = {"subscribe": 0, "unsubscribe": 0}
+
+    def subscribe(self, instrument, feed_type=None):
+        self.frames["subscribe"] += 1
+        self.tokens["subscribe"] += len(instrument)
+
+    def unsubscribe(self, instrument, feed_type=None):
+        self.frames["unsubscribe"] += 1
+        self.tokens["unsubscribe"] += len(instrument)
+
+    def websocket_connected(self):
+        return True
+
+
+def recording_subscriber():
+    '''WSSubscriber on a FeedRecorder with send pacing switched off.'''
+    from shared import FrameClock, SharedList
+    from socket_utils import WSSubscriber
+
+    subscriber = WSSubscriber(SharedList(), FeedRecorder())
+    subscriber.clock = FrameClock(0)
+    return subscriber
+
+
+def trending_ladders(recenters=300, strikes=10, seed=3):
+    '''Per underlying, the ladders ChainMaker would emit on a trending day.'''
+    rng = np.random.default_rng(seed)
+    ladders = []
+    for symbol, base in (("NIFTY", 40000), ("BANKNIFTY", 80000), ("FINNIFTY", 120000)):
+        atm = base
+        for _ in range(recenters):
+            atm += int(rng.choice((-1, 1, 1)))
+            ladders.append((symbol, [f"NFO|{atm + i}" for i in range(-strikes, strikes + 1)]))
+    return ladders
+
+
+def bench_subscriptions(recenters=300):
+    ladders = trending_ladders(recenters)
+    subscriber = recording_subscriber()
+    t0 = time.perf_counter()
+    for symbol, tokens in ladders:
+        subscriber.update_newsublist(tokens, consumer=symbol)
+        subscriber.flush()
+    elapsed_ms = (time.perf_counter() - t0) * 1000
+    live = len(subscriber.subscribedlist)
+
+    legacy = recording_subscriber()
+    for symbol, tokens in ladders:
+        legacy.update_newsublist(tokens)
+        legacy.flush()
+    print(f"subscribe-only     :: {len(legacy.subscribedlist):5d} tokens live at close  {legacy.api.tokens}")
+    print(f"reference counted  :: {live:5d} tokens live at close  {subscriber.api.tokens}")
+    print(f"{len(ladders)} ladder updates in {elapsed_ms:.2f} ms ({elapsed_ms * 1000 / len(ladders):.1f} us each)")
+    assert live == 3 * 21
+
+
+def bench_feed_types(recenters=300, strikes=10, depth_strikes=2):
+    from Noren import FeedType
+    from socket_utils import FeedApplier
+
+    def feed_types(tokens):
+        atm = len(tokens) // 2
+        return {
+            token: FeedType.SNAPQUOTE if abs(i - atm) <= depth_strikes else FeedType.TOUCHLINE
+            for i, token in enumerate(tokens)
+        }
+
+    subscriber = recording_subscriber()
+    for symbol, tokens in trending_ladders(recenters, strikes):
+        subscriber.update_newsublist(feed_types(tokens), consumer=symbol)
+        subscriber.flush()
+    stats = subscriber.stats()
+    print(f"live at close      :: {stats}")
+
+    # one update per live token, at the frame sizes each feed type actually streams
+    applier = FeedApplier(SharedDict())
+    depth_bytes = touchline_bytes = 0
+    for token, feed_type in subscriber.live.items():
+        token = token.split("|")[1]
+        frame = (DEPTH if feed_type == FeedType.SNAPQUOTE else TOUCHLINE) % (token, "101.05")
+        applier.put({"t": "df" if feed_type == FeedType.SNAPQUOTE else "tf", "tk": token})
+        if feed_type == FeedType.SNAPQUOTE:
+            depth_bytes += len(frame)
+        else:
+            touchline_bytes += len(frame)
+    all_depth = len(subscriber.live) * len(DEPTH % ("35000", "101.05"))
+    mixed = depth_bytes + touchline_bytes
+    print(f"frames per round   :: {applier.stats()['frames']}")
+    print(f"bytes per round    :: {mixed} mixed vs {all_depth} all-depth ({1 - mixed / all_depth:.0%} saved)")
+
+
+def bench_storm(seconds=60, moves_per_second=4, seed=9):
+    '''Choppy market: every underlying recenters several times inside each second.'''
+    rng = np.random.default_rng(seed)
+    bursts = []
+    atms = {"NIFTY": 40000, "BANKNIFTY": 80000, "FINNIFTY": 120000}
+    for _ in range(seconds):
+        burst = []
+        for _ in range(moves_per_second):
+            for symbol in atms:
+                atms[symbol] += int(rng.choice((-1, 1)))
+                burst.append((symbol, [f"NFO|{atms[symbol] + i}" for i in range(-10, 11)]))
+        bursts.append(burst)
+
+    for name, per_update in (("send per update", True), ("coalesced window", False)):
+        subscriber = recording_subscriber()
+        for burst in bursts:
+            for symbol, tokens in burst:
+                subscriber.update_newsublist(tokens, consumer=symbol)
+                if per_update:
+                    subscriber.flush()
+            subscriber.flush()
+        stats = subscriber.stats()
+        print(f"{name:17s} :: {stats['frames_sent']:5d} frames  {subscriber.api.tokens}  cancelled={stats['cancelled']}")
+
+
+def choppy_session(seconds=3600, ticks_per_second=4, seed=21):
+    '''BANKNIFTY spot mean-reverting around the 44050 strike midpoint, with one trend leg.'''
+    rng = np.random.default_rng(seed)
+    count = seconds * ticks_per_second
+    prices = np.empty(count)
+    price = 44050.0
+    for i in range(count):
+        anchor = 44050.0 if i < count * 3 // 4 else 44350.0
+        price += 0.02 * (anchor - price) + rng.normal(0, 6)
+        prices[i] = price
+    return np.arange(count) / ticks_per_second, prices
+
+
+def bench_recenter():
+    from utils import ChainMaker
+
+    df = make_nfo_master()
+    times, prices = choppy_session()
+    print(f"{len(prices)} spot ticks, {prices.min():.0f}-{prices.max():.0f}")
+    with tempfile.TemporaryDirectory() as tmp:
+        sc = make_searchscrip(df)
+        sc.l_path = tmp
+        sc.symbol_cache["NSE"] = df.head(0)
+        for hysteresis, dwell_ms in ((0, 0), (0.1, 0), (0.1, 1000), (0.2, 2000)):
+            chain = ChainMaker(None, sc, SharedDict(ticks=TickArray()), {"banknifty": "26009"}, "BANKNIFTY", 10,
+                               hysteresis=hysteresis, dwell_ms=dwell_ms)
+            emitted = []
+            chain.chains_ready.connect(emitted.append)
+            for now, ltp in zip(times.tolist(), prices.tolist()):
+                if chain.atm_strike is None or chain.check_breach(ltp, now):
+                    chain.recenter(ltp)
+            print(f"hysteresis={hysteresis:<4} dwell={dwell_ms:5d} ms :: {len(emitted):5d} ladder rebuilds  {chain.stats()}")
+
+
+def bench_expiries(repeat=200):
+    from utils import ChainMaker
+
+    df = make_nfo_master()
+    with tempfile.TemporaryDirectory() as tmp:
+        sc = make_searchscrip(df)
+        sc.l_path = tmp
+        sc.symbol_cache["NSE"] = df.head(0)
+        for expiries in (("current",), ("current", "next"), ("current", "next", "monthly"), ("current", "current")):
+            chain = ChainMaker(None, sc, SharedDict(ticks=TickArray()), {"banknifty": "26009"}, "BANKNIFTY", 10,
+                               expiries=expiries)
+            subscriber = recording_subscriber()
+            emitted = []
+            chain.chain_list_ready.connect(lambda tokens: subscriber.update_newsublist(tokens, consumer="BANKNIFTY"))
+            chain.chains_ready.connect(emitted.append)
+            t0 = time.perf_counter()
+            for i in range(repeat):
+                chain.recenter(44000.0 + (i % 2) * 100)
+            elapsed_us = (time.perf_counter() - t0) * 1e6 / repeat
+            subscriber.flush()
+            print(f"{'+'.join(expiries):22s} :: {len(chain.expiries)} chains, {len(subscriber.live):3d} tokens live,"
+                  f" {elapsed_us:7.1f} us per recenter")
+
+
+class StartupApi(FeedRecorder):
+    '''FeedRecorder that also logs in and opens a websocket, each after a fixed delay.'''
+    def __init__(self, login_latency, connect_latency):
+        super().__init__()
+        self.login_latency = login_latency
+        self.connect_latency = connect_latency
+
+    def login(self, **kwargs):
+        time.sleep(self.login_latency)
+        return {"uname": "bench"}
+
+    def start_websocket(self, socket_open_callback=None, **kwargs):
+        threading.Timer(self.connect_latency, socket_open_callback).start()
+
+    def close_websocket(self):
+        pass
+
+
+def bench_startup_pipeline(master_latency=0.8, login_latency=0.5, connect_latency=0.3):
+    '''Startup with a slow symbol master, login and websocket connect: one after the other
+    as OCStreamer used to do it, against the Startup orchestrator.'''
+    from engine import StreamingEngine, Startup
+
+    df = make_nfo_master()
+    with tempfile.TemporaryDirectory() as tmp:
+        def make_engine():
+            engine = StreamingEngine(api=StartupApi(login_latency, connect_latency))
+            engine.sc = make_searchscrip(df)
+            engine.sc.l_path = tmp
+            engine.init_symbols = lambda: time.sleep(master_latency) or True
+            engine.login = lambda cred_file=None: engine.api.login()
+            return engine
+
+        engine = make_engine()
+        t0 = time.perf_counter()
+        engine.init_symbols()
+        engine.build()
+        engine.login()
+        engine.start_feed()
+        serial = (time.perf_counter() - t0) * 1000
+        engine.stop()
+
+        engine = make_engine()
+        t0 = time.perf_counter()
+        startup = Startup(engine).run()
+        startup.wait()
+        parallel = (time.perf_counter() - t0) * 1000
+        failed = [name for name, future in startup.steps.items() if future.exception()]
+        startup.shutdown()
+        engine.stop()
+    print(f"serial       :: {serial:8.1f} ms")
+    print(f"orchestrated :: {parallel:8.1f} ms  failed={failed}")
+
+
+STARTUP_SCRIPT = """
+import sys
+from OptionChainStreamer import StartupProfile, OCStreamer, QtWidgets
+profile = StartupProfile()
+profile.mark("imports")
+app = QtWidgets.QApplication(sys.argv)
+profile.mark("QApplication")
+window = OCStreamer(profile)
+window.show()
+app.processEvents()
+profile.mark("first paint")
+profile.report()
+"""
+
+EAGER_SCRIPT = """
+import time
+t0 = time.perf_counter()
+import pandas, httpx
+from PyQt5 import uic
+t1 = time.perf_counter()
+uic.loadUiType("MyUi.ui")
+t2 = time.perf_counter()
+print(f"pandas+httpx+uic    :: {(t1 - t0) * 1000:8.1f} ms")
+print(f"loadUiType          :: {(t2 - t1) * 1000:8.1f} ms")
+"""
+
+
+def bench_startup(runs=3):
+    '''Time to first paint of the window (symbol master and engine start come after it),
+    with a cold and a cached compiled UI, against what the old eager path paid up front.'''
+    import subprocess
+
+    env = dict(os.environ, QT_QPA_PLATFORM=os.environ.get("QT_QPA_PLATFORM", "offscreen"))
+    cwd = os.path.dirname(os.path.abspath(__file__))
+
+    def run(script):
+        return subprocess.run([sys.executable, "-c", script], cwd=cwd, env=env,
+                              capture_output=True, text=True, check=True).stdout
+
+    for cached in (False, True):
+        if not cached:
+            for path in (os.path.join(cwd, "ui_MyUi.py"),):
+                if os.path.exists(path):
+                    os.remove(path)
+        print("== cached ui" if cached else "== cold ui (compiles ui_MyUi.py)")
+        for _ in range(runs if cached else 1):
+            print(run(STARTUP_SCRIPT).rstrip())
+    print("== eager imports the window no longer waits for")
+    print(run(EAGER_SCRIPT).rstrip())
+
+
+BENCHMARKS = {
+    "registry": bench_registry,
+    "ladder": bench_ladder,
+    "master_cache": bench_master_cache,
+    "download": bench_download,
+    "tickstore": bench_tickstore,
+    "chain_read": bench_chain_read,
+    "change_set": bench_change_set,
+    "model_update": bench_model_update,
+    "paint": bench_paint,
+    "refresh": bench_refresh,
+    "ingest": bench_ingest,
+    "decode": bench_decode,
+    "recorder": bench_recorder,
+    "replay": bench_replay,
+    "rest": bench_rest,
+    "fanout": bench_fanout,
+    "bootstrap": bench_bootstrap,
+    "subscriptions": bench_subscriptions,
+    "feed_types": bench_feed_types,
+    "storm": bench_storm,
+    "recenter": bench_recenter,
+    "expiries": bench_expiries,
+    "startup": bench_startup,
+    "startup_pipeline": bench_startup_pipeline,
+}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Option chain streamer benchmarks")
+    parser.add_argument("names", nargs="*", help=f"any of {', '.join(BENCHMARKS)} (default: all)")
+    args = parser.parse_args()
+    for name in args.names or BENCHMARKS:
+        if name not in BENCHMARKS:
+            parser.error(f"unknown benchmark {name}")
+        print(f"== {name}")
+        BENCHMARKS[name]()
@@ -0,0 +1,350 @@
+import argparse
+import json
+import sys
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from shared import SharedDict, SharedList, TickArray
+from symbolsearch import SearchScrip
+from utils import IndexTableDataFetcher, ChainMaker, OptionChainDataFetcher, WebSocketMonitor
+from socket_utils import WebSocketHandler, WSSubscriber, QuoteBootstrap
+from others import ShoonyaApiPy, check_symbols
+from recorder import FrameRecorder
+from replay import ReplayApi
+
+
+class Sink:
+    '''Receives what the engine produces. Methods are called on engine threads, so a sink
+    must return quickly and do its own thread hopping if it needs one (see QtSink).'''
+    def on_index(self, table):
+        pass
+
+    def on_chain(self, symbol, expiry, table):
+        pass
+
+    def on_atm(self, symbol, atm):
+        pass
+
+    def on_status(self, text):
+        pass
+
+    def on_chain_added(self, symbol, expiries):
+        pass
+
+    def on_progress(self, done, total, text):
+        pass
+
+
+class ConsoleSink(Sink):
+    '''One line per chain update: ATM row of every expiry, at most every interval seconds.'''
+    def __init__(self, interval=1.0, stream=sys.stdout):
+        self.interval = interval
+        self.stream = stream
+        self.atm = {}
+        self.last = {}
+
+    def on_atm(self, symbol, atm):
+        self.atm[symbol] = atm
+
+    def on_chain(self, symbol, expiry, table):
+        now = time.monotonic()
+        if now - self.last.get((symbol, expiry), 0) < self.interval:
+            return
+        self.last[(symbol, expiry)] = now
+        atm = self.atm.get(symbol)
+        row = next((row for row in table if row[8] == atm), None)
+        if row is not None:
+            print(f"{symbol} {expiry:%d%b} ATM {atm:g} :: CE {row[7]} ({row[6]}) :: PE {row[9]} ({row[10]})".upper(),
+                  file=self.stream, flush=True)
+
+    def on_status(self, text):
+        print(text, file=self.stream, flush=True)
+
+    def on_progress(self, done, total, text):
+        print(f"[{done}/{total}] {text}", file=self.stream, flush=True)
+
+
+class JsonLinesSink(Sink):
+    '''Every update as one JSON object per line, for piping into other consumers.'''
+    def __init__(self, stream=sys.stdout):
+        self.stream = stream
+
+    def write(self, record):
+        self.stream.write(json.dumps(record, default=str) + "\n")
+        self.stream.flush()
+
+    def on_index(self, table):
+        self.write({"type": "index", "time": time.time(), "rows": table})
+
+    def on_chain(self, symbol, expiry, table):
+        self.write({"type": "chain", "time": time.time(), "symbol": symbol, "expiry": expiry, "rows": table})
+
+    def on_atm(self, symbol, atm):
+        self.write({"type": "atm", "time": time.time(), "symbol": symbol, "atm": atm})
+
+    def on_status(self, text):
+        self.write({"type": "status", "time": time.time(), "text": text})
+
+    def on_chain_added(self, symbol, expiries):
+        self.write({"type": "chain_added", "time": time.time(), "symbol": symbol, "expiries": expiries})
+
+    def on_progress(self, done, total, text):
+        self.write({"type": "progress", "time": time.time(), "done": done, "total": total, "text": text})
+
+
+class StreamingEngine:
+    '''The streaming pipeline without any UI: tick store, symbol master, subscription
+    manager, quote bootstrap, one ChainMaker per underlying and one fetcher per expiry.
+    Output goes to the sinks added with add_sink.'''
+    indices = {'nifty': '26000',
+               'banknifty': '26009',
+               'finnifty': '26037',
+               'vix': '26017',
+               }
+
+    def __init__(self, api=None, symbols=("BANKNIFTY", "NIFTY", "FINNIFTY"), expiries=('current', 'next'),
+                 no_of_strikes=10, max_fps=10, record_dir=None):
+        self.api = api or ShoonyaApiPy()
+        self.symbols = symbols
+        self.expiries = expiries
+        self.no_of_strikes = no_of_strikes
+        self.update_freq = 1000 // max_fps
+        self.feedJson = SharedDict(ticks=TickArray())
+        self.orderJson = SharedDict()
+        self.sc = SearchScrip()
+        self.tokenlist = SharedList()
+        self.subscribed_list = SharedList()
+        self.subscriber = WSSubscriber(self.subscribed_list, self.api, feedJson=self.feedJson)
+        self.wbhandler = WebSocketHandler(self.subscribed_list, self.feedJson, self.orderJson, self.subscriber, self.api)
+        self.bootstrap = None
+        if not isinstance(self.api, ReplayApi):
+            # a replay has no REST host, and live quotes would mix into the recorded session
+            self.bootstrap = QuoteBootstrap(self.feedJson, self.api)
+        self.wss_monitor = WebSocketMonitor(self.indices['banknifty'], self.feedJson, 60)
+        self.recorder = None
+        if record_dir is not None:
+            self.recorder = FrameRecorder(record_dir)
+            self.api.set_recorder(self.recorder)
+        self.index_fetcher = None
+        self.chains = {}
+        self.fetchers = {}
+        self.sinks = []
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+
+    def emit(self, event, *args):
+        for sink in self.sinks:
+            getattr(sink, event)(*args)
+
+    def init_symbols(self):
+        self.emit('on_status', "Initializing Symbols...")
+        return check_symbols(sc=self.sc, exch_list=["NSE", "NFO"], current_date=datetime.now().date())
+
+    def start_core(self):
+        '''Subscriber, quote bootstrap, feed monitor and the index table. None of these
+        need the symbol master, so they run from the first moment.'''
+        if self.index_fetcher is not None:
+            return
+        self.index_fetcher = IndexTableDataFetcher(self.feedJson, self.indices, self.update_freq)
+        self.index_fetcher.table_data_ready.connect(lambda table: self.emit('on_index', table))
+        self.subscriber.start()
+        if self.bootstrap is not None:
+            self.bootstrap.start()
+        self.wss_monitor.start()
+        self.index_fetcher.start()
+        if self.recorder is not None:
+            self.recorder.start()
+
+    def add_chain(self, symbol):
+        '''Resolves the ladders of symbol (needs the symbol master) and starts its
+        ChainMaker and one fetcher per expiry. Safe to call for several symbols at once.'''
+        chain = ChainMaker(self.api, self.sc, self.feedJson, self.indices, symbol, self.no_of_strikes,
+                           self.update_freq, expiries=self.expiries)
+        chain.chain_list_ready.connect(lambda tokens: self.subscriber.update_newsublist(tokens, consumer=symbol))
+        if self.bootstrap is not None:
+            chain.chain_list_ready.connect(self.bootstrap.put)
+        chain.atmstrike_ready.connect(lambda atm: self.emit('on_atm', symbol, atm))
+        fetchers = []
+        for expiry in chain.expiries:
+            fetcher = OptionChainDataFetcher(self.feedJson, self.update_freq, expiry=expiry)
+            chain.chains_ready.connect(fetcher.process_chains)
+            fetcher.table_data_ready.connect(
+                lambda table, expiry=expiry: self.emit('on_chain', symbol, expiry, table))
+            self.fetchers[(symbol, expiry)] = fetcher
+            fetchers.append(fetcher)
+        self.chains[symbol] = chain
+        self.emit('on_chain_added', symbol, list(chain.expiries))
+        for fetcher in fetchers:
+            fetcher.start()
+        chain.start()
+        return chain
+
+    def build(self):
+        '''Everything at once on the calling thread. Needs the symbol master.'''
+        self.start_core()
+        for symbol in self.symbols:
+            self.add_chain(symbol)
+
+    def login(self, cred_file='cred.yml'):
+        if isinstance(self.api, ReplayApi):
+            return self.api.login()
+        import yaml
+        import pyotp
+
+        with open(cred_file) as f:
+            cred = yaml.load(f, Loader=yaml.FullLoader)
+        return self.api.login(userid=cred['user'],
+                              password=cred['pwd'],
+                              twoFA=pyotp.TOTP(cred['token']).now(),
+                              vendor_code=cred['vc'],
+                              api_secret=cred['apikey'],
+                              imei=cred['imei'])
+
+    def start_feed(self):
+        '''Opens the websocket and subscribes the indices; chains follow on their first spot tick.
+        Safe to run again: a socket left from an earlier run is closed before the new one opens.'''
+        if not self.tokenlist:
+            self.tokenlist.append([f"NSE|{value}" for value in self.indices.values()])
+        self.wbhandler.close()
+        self.wbhandler.start()
+        self.subscriber.update_newsublist(self.tokenlist.get(), consumer="indices")
+
+    def logout(self):
+        if self.api.session_credentials() is None:
+            return None
+        self.wbhandler.close()
+        return self.api.logout()
+
+    def stop(self):
+        for thread in (self.index_fetcher, *self.fetchers.values(), *self.chains.values(), self.subscriber, self.bootstrap,
+                       self.recorder):
+            if thread is not None and thread.is_alive():
+                thread.stop()
+        if self.recorder is not None and self.recorder.is_alive():
+            self.recorder.join(2)
+
+
+class Startup:
+    '''Runs the startup steps on a thread pool, each as soon as the steps it depends on
+    have succeeded: symbol master and login in parallel, the websocket after login, and
+    every chain after the symbol master. Progress goes to the sinks' on_progress; a failed
+    step fails its dependents and leaves the others running.'''
+    def __init__(self, engine, cred_file='cred.yml', max_workers=8):
+        self.engine = engine
+        self.cred_file = cred_file
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="startup")
+        self.lock = threading.Lock()
+        self.done = 0
+        self.total = 0
+        self.steps = {}
+
+    def run(self):
+        engine = self.engine
+        engine.start_core()
+        symbols = self.step("symbol master", self.load_symbols)
+        self.connect()
+        for symbol in engine.symbols:
+            self.step(f"{symbol} chain", engine.add_chain, symbol, after=(symbols,))
+        return self
+
+    def connect(self):
+        '''Login then websocket. Also what the login button runs again after a failure.'''
+        login = self.step("login", self.login)
+        return self.step("websocket", self.engine.start_feed, after=(login,))
+
+    def step(self, name, fn, *args, after=()):
+        '''Future of fn(*args). Steps are submitted after their dependencies, so a worker
+        waiting on one only waits on work that is already running.'''
+        with self.lock:
+            self.total += 1
+        self.progress(f"{name} ...", count=False)
+
+        def run():
+            for dependency in after:
+                if dependency.exception() is not None:
+                    self.progress(f"{name} skipped")
+                    raise RuntimeError(f"{name} skipped")
+            try:
+                result = fn(*args)
+            except Exception as e:
+                self.progress(f"{name} failed :: {e}")
+                raise
+            self.progress(f"{name} ready")
+            return result
+
+        future = self.steps[name] = self.pool.submit(run)
+        return future
+
+    def progress(self, text, count=True):
+        with self.lock:
+            if count:
+                self.done += 1
+            done, total = self.done, self.total
+        self.engine.emit('on_progress', done, total, text)
+
+    def load_symbols(self):
+        if not self.engine.init_symbols():
+            raise RuntimeError("Error Fetching Correct Symbolmaster.")
+
+    def login(self):
+        ret = self.engine.login(self.cred_file)
+        if ret is None:
+            self.engine.emit('on_status', "Error :: Please Check Credentials")
+            raise RuntimeError("Please Check Credentials")
+        self.engine.emit('on_status', f"Welcome {ret['uname'].title()}")
+        return ret
+
+    def wait(self, timeout=None):
+        '''True once every step has finished, successfully or not.'''
+        for future in list(self.steps.values()):
+            try:
+                future.exception(timeout)
+            except TimeoutError:
+                return False
+        return True
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Headless option chain streamer")
+    parser.add_argument("--symbols", nargs="+", default=["BANKNIFTY", "NIFTY", "FINNIFTY"])
+    parser.add_argument("--expiries", nargs="+", default=["current", "next"], help="current, next, far, monthly")
+    parser.add_argument("--strikes", type=int, default=10, help="strikes either side of the ATM")
+    parser.add_argument("--fps", type=int, default=10, help="max updates per second per table")
+    parser.add_argument("--sink", choices=["console", "jsonl"], default="console")
+    parser.add_argument("--out", help="file for the jsonl sink (default: stdout)")
+    parser.add_argument("--cred", default="cred.yml")
+    parser.add_argument("--record", metavar="DIR", help="record raw websocket frames under DIR, one folder per session")
+    parser.add_argument("--replay", metavar="SESSION", help="play back a recorded session directory instead of connecting")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed, 1 = recorded timing, 0 = as fast as possible")
+    args = parser.parse_args()
+
+    api = ReplayApi(args.replay, speed=args.speed or None) if args.replay else None
+    engine = StreamingEngine(api=api, symbols=args.symbols, expiries=args.expiries, no_of_strikes=args.strikes, max_fps=args.fps,
+                             record_dir=args.record)
+    if args.sink == "jsonl":
+        engine.add_sink(JsonLinesSink(open(args.out, "a") if args.out else sys.stdout))
+    else:
+        engine.add_sink(ConsoleSink())
+
+    startup = Startup(engine, cred_file=args.cred).run()
+    startup.wait()
+    failed = [name for name, future in startup.steps.items() if future.exception()]
+    # a replay of an older session can still play the index feed without that day's chains
+    if failed and (api is None or "websocket" in failed):
+        sys.exit("Error :: Startup failed")
+    done = api.finished if api is not None else threading.Event()
+    try:
+        while not done.wait(1):
+            pass
+        engine.emit('on_status', f"Replay finished :: {api.stats()}")
+    except KeyboardInterrupt:
+        pass
+    startup.shutdown()
+    engine.stop()
+    engine.logout()
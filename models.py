@@ -1,6 +1,8 @@
 from PyQt5.QtCore import QAbstractTableModel, Qt, pyqtSignal
 from PyQt5.QtGui import QBrush, QColor
 
+YELLOW = (255, 255, 0)
+
 class Predicate:
     def __init__(self, item):
         self.item = item
@@ -11,6 +13,16 @@ class Predicate:
         except TypeError:
             return False
 
+def changed_cells(old_data, new_data):
+    '''Yields (row, changed columns) for rows that differ between two tables of equal length.'''
+    for row, (old_row, new_row) in enumerate(zip(old_data, new_data)):
+        if old_row is new_row or old_row == new_row:
+            continue
+        columns = [column for column, (old, new) in enumerate(zip(old_row, new_row)) if old != new]
+        columns += range(len(old_row), len(new_row))
+        if columns:
+            yield row, columns
+
 class IndexTableModel(QAbstractTableModel):
     def __init__(self, data, parent=None):
         super(IndexTableModel, self).__init__(parent)
@@ -48,10 +60,23 @@ class IndexTableModel(QAbstractTableModel):
         return None
     
     def update_data(self, data):
-        if self._data != data:
+        '''Emits dataChanged per changed cell, resetting only when the indices shown change.'''
+        if self._data is data:
+            return
+        if [row[:1] for row in self._data] != [row[:1] for row in data]:
             self.beginResetModel()
             self._data = data
             self.endResetModel()
+            return
+        old_data = self._data
+        self._data = data
+        for row, columns in changed_cells(old_data, data):
+            for column in columns:
+                self.emit_cell_changed(row, column)
+
+    def emit_cell_changed(self, row, column):
+        index = self.index(row, column)
+        self.dataChanged.emit(index, index)
 
 
 class OptionChainTableModel(QAbstractTableModel):
@@ -77,6 +102,21 @@ class OptionChainTableModel(QAbstractTableModel):
         self.ltp_columns = {
             self.ce_ltp_index, self.pe_ltp_index
             }
+
+        self.ce_ohl_indexes = (
+            self.header_row.index('CE OPEN'), self.header_row.index('CE HIGH'), self.header_row.index('CE LOW'),
+            )
+        self.pe_ohl_indexes = (
+            self.header_row.index('PE OPEN'), self.header_row.index('PE HIGH'), self.header_row.index('PE LOW'),
+            )
+
+        self.count_columns = {
+            self.header_row.index('CE VOL'), self.header_row.index('CE COI'), self.header_row.index('CE OI'),
+            self.header_row.index('PE OI'), self.header_row.index('PE COI'), self.header_row.index('PE VOL'),
+            }
+
+        self.brushes = {}
+        self.compute_backgrounds()
         
     def rowCount(self, parent=None):
         return len(self._data)
@@ -102,8 +142,16 @@ class OptionChainTableModel(QAbstractTableModel):
         else:
             return 0
         
+    def format_value(self, value, column):
+        if isinstance(value, float) and column != self.strikes_index:
+            if column in self.count_columns:
+                return str(int(value))
+            return '%.2f' % value
+        return str(value)
+
     def set_highlight_value(self, value):
         self.highlight_value = value
+        self.compute_backgrounds()
         top_left = self.index(0, 0)
         bottom_right = self.index(self.rowCount() - 1, self.columnCount() - 1)
         self.dataChanged.emit(top_left, bottom_right)
@@ -113,98 +161,60 @@ class OptionChainTableModel(QAbstractTableModel):
         column = index.column()
 
         if role == Qt.DisplayRole:
-            return str(self._data[row][column])
+            return self.format_value(self._data[row][column], column)
 
         if role == Qt.BackgroundRole:
-            
-            if column == self.strikes_index:
-                return QBrush(QColor(173, 216, 230))# QBrush(QColor(173, 216, 230))  
-            
-            column_values = [self.convert_to_int(row_data[column]) for row_data in self._data if row_data[column] != '']
-                       
-            if self.should_highlight_row(row):
-                if column in self.highlight_columns:
-                    if column_values:
-                        max_values = sorted(column_values, reverse=True)[:2]  
-                        if self.convert_to_int(self._data[row][column]) in max_values:
-                            rank = max_values.index(self.convert_to_int(self._data[row][column]))
-                            color_value =  int(255 - (1- rank / 2) * 128) 
-                            #return QBrush(QColor(185, color_value, 232)) 
-                            return QBrush(QColor(color_value, 255, 216))
-                        else:
-                            return QBrush(QColor(Qt.yellow))
-                elif column in self.ltp_columns:
-                    ce_open = self.convert_to_float(self._data[row][self.header_row.index('CE OPEN')])
-                    ce_high = self.convert_to_float(self._data[row][self.header_row.index('CE HIGH')])
-                    ce_low = self.convert_to_float(self._data[row][self.header_row.index('CE LOW')])
-                    pe_open = self.convert_to_float(self._data[row][self.header_row.index('PE OPEN')])
-                    pe_high = self.convert_to_float(self._data[row][self.header_row.index('PE HIGH')])
-                    pe_low = self.convert_to_float(self._data[row][self.header_row.index('PE LOW')])
-                    ce_ltp = self.convert_to_float(self._data[row][self.header_row.index('CE LTP')])
-                    pe_ltp = self.convert_to_float(self._data[row][self.header_row.index('PE LTP')])
-
-                    if column == self.ce_ltp_index:
-                        if ce_open == ce_high == ce_low:
-                            return QBrush(QColor(Qt.yellow))                      
-                        elif ce_open == ce_high and ce_ltp is not None :
-                            return QBrush(QColor(255, 220, 220)) 
-                        elif ce_open == ce_low and ce_ltp is not None:
-                            return QBrush(QColor(220, 255, 220)) 
-                        else:
-                            return QBrush(QColor(Qt.yellow))
-
-                    if column == self.pe_ltp_index:
-                        if pe_open == pe_high == pe_low:
-                            return QBrush(QColor(Qt.yellow))                        
-                        elif pe_open == pe_high and pe_ltp is not None:
-                            return QBrush(QColor(255, 220, 220)) 
-                        elif pe_open == pe_low and pe_ltp is not None:
-                            return QBrush(QColor(220, 255, 220)) 
-                        else:
-                            return QBrush(QColor(Qt.yellow))
-                else:
-                    return QBrush(QColor(Qt.yellow))
-            elif column in self.highlight_columns:
-                if column_values:
-                    max_values = sorted(column_values, reverse=True)[:2]  
-                    if self.convert_to_int(self._data[row][column]) in max_values:
-                        rank = max_values.index(self.convert_to_int(self._data[row][column]))
-                        color_value =  int(255 - (1- rank / 2) * 128) 
-                        #return QBrush(QColor(185, color_value, 232)) 
-                        return QBrush(QColor(color_value, 255, 216))
-            elif column in self.ltp_columns:
-                ce_open = self.convert_to_float(self._data[row][self.header_row.index('CE OPEN')])
-                ce_high = self.convert_to_float(self._data[row][self.header_row.index('CE HIGH')])
-                ce_low = self.convert_to_float(self._data[row][self.header_row.index('CE LOW')])
-                pe_open = self.convert_to_float(self._data[row][self.header_row.index('PE OPEN')])
-                pe_high = self.convert_to_float(self._data[row][self.header_row.index('PE HIGH')])
-                pe_low = self.convert_to_float(self._data[row][self.header_row.index('PE LOW')])
-                ce_ltp = self.convert_to_float(self._data[row][self.header_row.index('CE LTP')])
-                pe_ltp = self.convert_to_float(self._data[row][self.header_row.index('PE LTP')])
-
-                if column == self.ce_ltp_index:
-                    if ce_open == ce_high == ce_low:
-                        return                        
-                    elif ce_open == ce_high and ce_ltp is not None :
-                        return QBrush(QColor(255, 220, 220))  
-                    elif ce_open == ce_low and ce_ltp is not None:
-                        return QBrush(QColor(220, 255, 220)) 
-                
-                if column == self.pe_ltp_index:
-                    if pe_open == pe_high == pe_low:
-                        return                        
-                    elif pe_open == pe_high and pe_ltp is not None:
-                        return QBrush(QColor(255, 220, 220)) 
-                    elif pe_open == pe_low and pe_ltp is not None:
-                        return QBrush(QColor(220, 255, 220)) 
-                       
+            return self.backgrounds[row][column]
+
         return None
-    
-    def should_highlight_row(self, row):
-        strikes_column = self.header_row.index('STRIKES')
-        value = self._data[row][strikes_column]
-        return value == self.highlight_value   # highlight test
-    
+
+    def brush(self, *rgb):
+        '''Brushes are shared per colour instead of allocated on every paint.'''
+        brush = self.brushes.get(rgb)
+        if brush is None:
+            brush = QBrush(QColor(*rgb))
+            self.brushes[rgb] = brush
+        return brush
+
+    def ltp_background(self, row_data, open_index, high_index, low_index, ltp_index, highlighted):
+        open_ = self.convert_to_float(row_data[open_index])
+        high = self.convert_to_float(row_data[high_index])
+        low = self.convert_to_float(row_data[low_index])
+        ltp = self.convert_to_float(row_data[ltp_index])
+        if open_ == high == low:
+            return self.brush(*YELLOW) if highlighted else None
+        elif open_ == high and ltp is not None:
+            return self.brush(255, 220, 220)
+        elif open_ == low and ltp is not None:
+            return self.brush(220, 255, 220)
+        return self.brush(*YELLOW) if highlighted else None
+
+    def compute_backgrounds(self):
+        '''Background of every cell, worked out once per data or ATM update: the top 2 values
+        of each OI/COI column by rank, open=high/open=low on the LTP cells and the ATM row.'''
+        ranks = {}
+        for column in self.highlight_columns:
+            column_values = [self.convert_to_int(row_data[column]) for row_data in self._data if row_data[column] != '']
+            max_values = sorted(column_values, reverse=True)[:2]
+            ranks[column] = {value: rank for rank, value in reversed(list(enumerate(max_values)))}
+
+        strike_brush = self.brush(173, 216, 230)
+        backgrounds = []
+        for row_data in self._data:
+            highlighted = row_data[self.strikes_index] == self.highlight_value
+            row_backgrounds = [self.brush(*YELLOW) if highlighted else None] * len(self.header_row)
+            row_backgrounds[self.strikes_index] = strike_brush
+            for column, column_ranks in ranks.items():
+                rank = column_ranks.get(self.convert_to_int(row_data[column]))
+                if rank is not None:
+                    row_backgrounds[column] = self.brush(int(255 - (1 - rank / 2) * 128), 255, 216)
+                elif not column_ranks:
+                    row_backgrounds[column] = None
+            row_backgrounds[self.ce_ltp_index] = self.ltp_background(row_data, *self.ce_ohl_indexes, self.ce_ltp_index, highlighted)
+            row_backgrounds[self.pe_ltp_index] = self.ltp_background(row_data, *self.pe_ohl_indexes, self.pe_ltp_index, highlighted)
+            backgrounds.append(row_backgrounds)
+        self.backgrounds = backgrounds
+
     def headerData(self, section, orientation, role=Qt.DisplayRole):
         if role == Qt.DisplayRole:
             if orientation == Qt.Horizontal:
@@ -213,8 +223,30 @@ class OptionChainTableModel(QAbstractTableModel):
         return None
     
     def update_data(self, data):
-        if self._data != data:
+        '''Emits dataChanged per cell whose value or background changed and resets only
+        when the strike set changes.'''
+        if self._data is data:
+            return
+        strikes = [row[self.strikes_index] for row in data]
+        if strikes != [row[self.strikes_index] for row in self._data]:
             self.beginResetModel()
             self._data = data
+            self.compute_backgrounds()
             self.endResetModel()
-           
\ No newline at end of file
+            return
+        old_data = self._data
+        old_backgrounds = self.backgrounds
+        self._data = data
+        self.compute_backgrounds()
+        changed = {(row, column) for row, columns in changed_cells(old_data, data) for column in columns}
+        for row, (old_row, new_row) in enumerate(zip(old_backgrounds, self.backgrounds)):
+            for column, (old, new) in enumerate(zip(old_row, new_row)):
+                if old is not new:
+                    changed.add((row, column))
+        for row, column in sorted(changed):
+            self.emit_cell_changed(row, column)
+
+    def emit_cell_changed(self, row, column):
+        # QAbstractItemView repaints the whole viewport for multi-cell ranges, single cells only their rect
+        index = self.index(row, column)
+        self.dataChanged.emit(index, index)
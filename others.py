@@ -1,10 +1,14 @@
-from Noren import NorenApi
+from Noren import NorenApi, AsyncNorenApi
 from time import sleep
 
 class ShoonyaApiPy(NorenApi):
     def __init__(self):
         NorenApi.__init__(self, host='https://api.shoonya.com/NorenWClientTP/', websocket='wss://api.shoonya.com/NorenWSTP/')
 
+class AsyncShoonyaApiPy(AsyncNorenApi):
+    def __init__(self, **kwargs):
+        AsyncNorenApi.__init__(self, host='https://api.shoonya.com/NorenWClientTP/', websocket='wss://api.shoonya.com/NorenWSTP/', **kwargs)
+
 
 def isWithinSixDays(input_date,expiryDate):
     diff = expiryDate - input_date
@@ -17,7 +21,7 @@ def check_symbols(sc,exch_list,current_date,hard_refresh=False, retry=1):
         if retry <= 10:
             print(f"Retry == {retry}")
             sleep(3)
-            check_symbols(sc=sc,exch_list=exch_list,current_date=current_date,hard_refresh=True, retry= retry+1)
+            return check_symbols(sc=sc,exch_list=exch_list,current_date=current_date,hard_refresh=True, retry= retry+1)
         else:
             print("Error Fetching Correct Symbolmaster.")
             return False
@@ -0,0 +1,137 @@
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+MAGIC = b"NRFRAME1"
+# magic, wall clock ns and monotonic ns at file open: maps receive times back to wall clock
+FILE_HEADER = struct.Struct("<8sqq")
+# monotonic receive time ns, payload length
+RECORD_HEADER = struct.Struct("<qI")
+
+
+class FrameRecorder(threading.Thread):
+    '''Append-only log of raw websocket frames, one directory per session. Every record is
+    the monotonic receive time, the payload length and the frame as received (utf-8), so
+    files are length-prefixed and can be read back with mmap (see read_frames).
+
+    record() only appends to a deque on the socket thread. This thread drains it every
+    flush_ms, packs the batch into one buffer, writes it and rotates to a new file once
+    the current one passes max_bytes. Frames recorded after stop() are ignored; every
+    frame accepted before it is written before the file closes.'''
+    def __init__(self, directory, session=None, max_bytes=256 * 1024 * 1024, flush_ms=200):
+        super().__init__()
+        self.daemon = True
+        self.session = session or datetime.now().strftime("session-%Y%m%d-%H%M%S")
+        self.path = os.path.join(directory, self.session)
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_ms / 1000
+        self.pending = deque()
+        self.lock = threading.Lock()
+        self.running = True
+        self.stopped = threading.Event()
+        self.file = None
+        self.file_index = 0
+        self.file_bytes = 0
+        self.frames = 0
+        self.bytes = 0
+        self.batches = 0
+        self.files = []
+
+    def record(self, message):
+        with self.lock:
+            if self.running:
+                self.pending.append((time.monotonic_ns(), message))
+
+    def run(self):
+        os.makedirs(self.path, exist_ok=True)
+        while self.running:
+            self.stopped.wait(self.flush_interval)
+            self.flush()
+        # stop() cleared running under the lock, so nothing can be queued after this drain
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def flush(self):
+        pending = self.pending
+        if not pending:
+            return
+        pack = RECORD_HEADER.pack
+        popleft = pending.popleft
+        chunks = []
+        append = chunks.append
+        for _ in range(len(pending)):
+            received, message = popleft()
+            if message.__class__ is str:
+                message = message.encode()
+            append(pack(received, len(message)))
+            append(message)
+        batch = b"".join(chunks)
+        if self.file is None or self.file_bytes >= self.max_bytes:
+            self.rotate()
+        self.file.write(batch)
+        self.file.flush()
+        self.file_bytes += len(batch)
+        self.bytes += len(batch)
+        self.frames += len(chunks) // 2
+        self.batches += 1
+
+    def rotate(self):
+        if self.file is not None:
+            self.file.close()
+        name = os.path.join(self.path, f"frames-{self.file_index:05d}.bin")
+        self.file_index += 1
+        self.file = open(name, "ab")
+        if self.file.tell() == 0:
+            self.file.write(FILE_HEADER.pack(MAGIC, time.time_ns(), time.monotonic_ns()))
+        self.file_bytes = self.file.tell()
+        self.files.append(name)
+
+    def stop(self):
+        '''Stops accepting frames, writes whatever is still queued and closes the file.'''
+        with self.lock:
+            self.running = False
+        self.stopped.set()
+
+    def stats(self):
+        return {"frames": self.frames, "bytes": self.bytes, "batches": self.batches,
+                "files": len(self.files), "queued": len(self.pending)}
+
+
+def session_files(path):
+    '''Frame files of one session directory in write order.'''
+    return sorted(os.path.join(path, name) for name in os.listdir(path)
+                  if name.startswith("frames-") and name.endswith(".bin"))
+
+
+def read_frames(path):
+    '''(monotonic receive ns, frame bytes) for every record in one frame file, read
+    through mmap. A record cut short by a crash mid-write ends the file.'''
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size < FILE_HEADER.size:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            magic, wall_ns, mono_ns = FILE_HEADER.unpack_from(data)
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a frame recording")
+            offset = FILE_HEADER.size
+            end = len(data)
+            unpack = RECORD_HEADER.unpack_from
+            while offset + RECORD_HEADER.size <= end:
+                received, length = unpack(data, offset)
+                offset += RECORD_HEADER.size
+                if offset + length > end:
+                    break
+                yield received, data[offset:offset + length]
+                offset += length
+
+
+def read_session(path):
+    '''Every frame of a session directory, oldest first.'''
+    for name in session_files(path):
+        yield from read_frames(name)
@@ -0,0 +1,114 @@
+import threading
+import time
+
+from Noren import NorenApi
+from recorder import read_session
+
+
+class ReplayApi(NorenApi):
+    '''NorenApi whose websocket plays back a session recorded by recorder.FrameRecorder,
+    so the whole pipeline runs offline. speed=1 keeps the recorded inter-arrival times,
+    speed=N plays N times faster and speed=None as fast as the consumer takes frames.
+
+    decode='live' sends every frame through the real __on_data_callback (decode and
+    dispatch, as on the socket thread). decode='ahead' decodes the session before playback
+    and calls the feed/order callbacks directly, which leaves only the pipeline downstream
+    of WebSocketHandler.event_handler_feed_update in the measurement.
+
+    login/logout answer locally and subscriptions are only counted: the recording already
+    holds whatever was subscribed when it was made.'''
+    def __init__(self, path, speed=1.0, decode='live', **kwargs):
+        NorenApi.__init__(self, host='http://replay/', websocket='ws://replay/', **kwargs)
+        self.path = path
+        self.speed = speed
+        self.decode = decode
+        self.frames = list(read_session(path))
+        self.subscribed = {}
+        self.replayed = 0
+        self.max_lag = 0.0
+        self.elapsed = 0.0
+        self.finished = threading.Event()
+        self.thread = None
+
+    def login(self, *args, **kwargs):
+        self.set_session("REPLAY", "", "")
+        return {"stat": "Ok", "uname": "replay"}
+
+    def logout(self):
+        self.set_session(None, None, None)
+        return {"stat": "Ok"}
+
+    def subscribe(self, instrument, feed_type=None):
+        for token in [instrument] if isinstance(instrument, str) else instrument:
+            self.subscribed[token] = feed_type
+
+    def unsubscribe(self, instrument, feed_type=None):
+        for token in [instrument] if isinstance(instrument, str) else instrument:
+            self.subscribed.pop(token, None)
+
+    def start_websocket(self, subscribe_callback=None, order_update_callback=None, socket_open_callback=None,
+                        socket_close_callback=None, socket_error_callback=None):
+        # same callback wiring NorenApi.start_websocket does, minus the socket
+        self._NorenApi__subscribe_callback = subscribe_callback
+        self._NorenApi__order_update_callback = order_update_callback
+        self._NorenApi__on_open = socket_open_callback
+        self._NorenApi__on_disconnect = socket_close_callback
+        self._NorenApi__on_error = socket_error_callback
+        self._NorenApi__build_dispatch()
+        self._NorenApi__websocket_connected = True
+        self.finished.clear()
+        self.thread = threading.Thread(target=self.play, daemon=True)
+        self.thread.start()
+
+    def close_websocket(self):
+        self._NorenApi__websocket_connected = False
+
+    def sends(self):
+        '''(receive ns, send function, arguments) for every frame of the session, per decode.'''
+        # the connect ack is answered by socket_open_callback before playback starts
+        if self.decode == 'live':
+            on_data = self._NorenApi__on_data_callback
+            return [(received, on_data, (None, frame.decode())) for received, frame in self.frames
+                    if b'"t":"ck"' not in frame]
+        decode = self._NorenApi__decode
+        dispatch = self._NorenApi__dispatch
+        sends = []
+        for received, frame in self.frames:
+            message = decode(frame)
+            handler = dispatch.get(message.get("t"))
+            if handler is not None and message.get("t") != "ck":
+                sends.append((received, handler, (message,)))
+        return sends
+
+    def play(self):
+        sends = self.sends()
+        on_open = self._NorenApi__on_open
+        if on_open is not None:
+            on_open()
+        start = time.perf_counter()
+        first = sends[0][0] if sends else 0
+        scale = 1e-9 / self.speed if self.speed else 0
+        max_lag = 0.0
+        for received, send, args in sends:
+            if not self._NorenApi__websocket_connected:
+                break
+            if scale:
+                due = start + (received - first) * scale
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                elif -delay > max_lag:
+                    max_lag = -delay
+            send(*args)
+            self.replayed += 1
+        self.elapsed = time.perf_counter() - start
+        self.max_lag = max_lag
+        self._NorenApi__websocket_connected = False
+        self.finished.set()
+        on_disconnect = self._NorenApi__on_disconnect
+        if on_disconnect is not None:
+            on_disconnect()
+
+    def stats(self):
+        return {"frames": len(self.frames), "replayed": self.replayed, "elapsed_s": self.elapsed,
+                "max_lag_ms": self.max_lag * 1000, "subscribed": len(self.subscribed)}
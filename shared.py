@@ -1,39 +1,271 @@
+import importlib
 import threading
+import time
+from collections.abc import Mapping
+from types import MappingProxyType
+import numpy as np
+
+TICK_FIELDS = ('lp', 'c', 'o', 'h', 'l', 'v', 'oi', 'poi', 'bp1', 'sp1', 'bq1', 'sq1')
+TICK_DTYPE = np.dtype([(field, 'f8') for field in TICK_FIELDS])
+
+class TickArray:
+    '''Numeric tick fields in a preallocated structured array, one slot per instrument.
+    Keys are interned to slots once ("NFO|35001" -> 7) and feed values are parsed to
+    float on ingest, so readers take whole chains as one vectorized slice. Missing
+    values are NaN. Every write bumps version and stamps the slot with it, so readers
+    can ask which slots changed since the version they last saw.'''
+    def __init__(self, capacity=256):
+        self.ticks = np.full(capacity, np.nan, dtype=TICK_DTYPE)
+        self.stamps = np.zeros(capacity, dtype=np.int64)
+        self.slots = {}
+        self.size = 0
+        self.version = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def token_of(key):
+        return str(key).rsplit('|', 1)[-1]
+
+    def intern(self, keys):
+        '''Returns slots for "EXCH|token" (or bare token) keys, allocating new ones as needed.'''
+        with self.lock:
+            slots = []
+            for key in keys:
+                token = self.token_of(key)
+                slot = self.slots.get(token)
+                if slot is None:
+                    if self.size == len(self.ticks):
+                        grown = np.full(len(self.ticks) * 2, np.nan, dtype=TICK_DTYPE)
+                        grown[:self.size] = self.ticks
+                        stamps = np.zeros(len(grown), dtype=np.int64)
+                        stamps[:self.size] = self.stamps
+                        self.ticks = grown
+                        self.stamps = stamps
+                    slot = self.size
+                    self.slots[token] = slot
+                    self.size += 1
+                slots.append(slot)
+            return np.array(slots, dtype=np.intp)
+
+    def slot(self, key):
+        return self.slots.get(self.token_of(key))
+
+    def write(self, token, message):
+        slot = self.slots.get(token)
+        if slot is None:
+            return
+        with self.lock:
+            row = self.ticks[slot]
+            for field in TICK_FIELDS:
+                value = message.get(field)
+                if value is not None:
+                    try:
+                        row[field] = float(value)
+                    except ValueError:
+                        pass
+            self.version += 1
+            self.stamps[slot] = self.version
+
+    def read(self, slots):
+        '''Copy of the rows at slots, a structured array with TICK_FIELDS columns.'''
+        with self.lock:
+            return self.ticks[slots]
+
+    def changed_since(self, version):
+        '''Slots written after version.'''
+        with self.lock:
+            return np.flatnonzero(self.stamps[:self.size] > version)
+
+    def value(self, key, field):
+        slot = self.slot(key)
+        if slot is None:
+            return None
+        value = self.ticks[field][slot]
+        return None if np.isnan(value) else float(value)
+
+class FeedSnapshot(Mapping):
+    '''Immutable view of the tick store at one version. Tick dicts are replaced, never
+    mutated, by SharedDict.write so a snapshot stays consistent after later writes.'''
+    __slots__ = ('version', '_data')
+
+    def __init__(self, data, version):
+        self._data = MappingProxyType(data)
+        self.version = version
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
 
 class SharedDict:
-    def __init__(self):
+    def __init__(self, ticks=None):
+        '''ticks is an optional TickArray kept in step with every write.'''
         self.feedJson = {}
+        self.ticks = ticks
         self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.version = 0
+        self._snapshot = FeedSnapshot({}, 0)
+        self.publish_lock = threading.Lock()
+        # monotonic time of the last write per key, what freshness is judged by
+        self.stamps = {}
 
     def read(self, key):
+        return self.feedJson.get(key, None)
+
+    def age(self, key):
+        '''Seconds since key was last written, None if it never was.'''
+        stamp = self.stamps.get(key)
+        return None if stamp is None else time.monotonic() - stamp
+
+    def mark_stale(self, keys):
+        '''Forgets when keys were last written, so they count as stale until written again.'''
         with self.lock:
-            return self.feedJson.get(key, None)
+            for key in keys:
+                self.stamps.pop(key, None)
 
     def write(self, key, value):
         with self.lock:
-            if key in self.feedJson:
-                self.feedJson[key].update(value)
-            else:
-                self.feedJson[key] = value
-                    
-    def get(self):
+            self._write(key, value, time.monotonic())
+            self.changed.notify_all()
+
+    def write_many(self, items):
+        '''Applies (key, value) pairs under one lock acquisition with a single notify.'''
+        now = time.monotonic()
+        with self.lock:
+            for key, value in items:
+                self._write(key, value, now)
+            self.changed.notify_all()
+
+    def seed_many(self, items, stale_after=None):
+        '''Fills (key, value) pairs from a REST snapshot without touching any field the feed
+        has already delivered for that key, so a quote that lands after a websocket tick
+        never overwrites it. A key last written more than stale_after seconds ago holds no
+        such tick and takes the whole quote. Returns how many keys got at least one field.'''
+        seeded = 0
+        now = time.monotonic()
         with self.lock:
-            return self.feedJson
+            for key, value in items:
+                stamp = self.stamps.get(key)
+                if stale_after is not None and (stamp is None or now - stamp > stale_after):
+                    missing = value
+                else:
+                    current = self.feedJson.get(key, {})
+                    missing = {field: v for field, v in value.items() if field not in current}
+                if missing:
+                    self._write(key, missing, now)
+                    seeded += 1
+            self.changed.notify_all()
+        return seeded
+
+    def _write(self, key, value, now):
+        current = self.feedJson.get(key)
+        if current is not None:
+            self.feedJson[key] = {**current, **value}
+        else:
+            self.feedJson[key] = dict(value)
+        self.stamps[key] = now
+        self.version += 1
+        if self.ticks is not None:
+            self.ticks.write(key, value)
+
+    def wait_for_change(self, version, timeout=None):
+        '''Blocks until a write moves the store past version, wake() is called or timeout
+        elapses, and returns the current version. Callers compare it with the one they passed.'''
+        with self.changed:
+            if self.version == version:
+                self.changed.wait(timeout)
+            return self.version
+
+    def wake(self):
+        with self.changed:
+            self.changed.notify_all()
+
+    def snapshot(self):
+        '''Returns the published snapshot, republishing first if there were writes since.
+        Readers never take the writer's lock: tick dicts are replaced, never mutated, so a
+        shallow copy of the token map (a single C-level dict.copy, which the ingest thread
+        cannot interleave with) already holds consistent ticks. publish_lock only keeps
+        concurrent readers from copying the same version twice. The version is read before
+        the copy, so a snapshot may hold ticks newer than its version, never older.'''
+        snapshot = self._snapshot
+        if snapshot.version == self.version:
+            return snapshot
+        with self.publish_lock:
+            version = self.version
+            if self._snapshot.version != version:
+                self._snapshot = FeedSnapshot(self.feedJson.copy(), version)
+            return self._snapshot
+
+    def get(self):
+        return self.snapshot()
+
+class Signal:
+    '''Plain stand-in for pyqtSignal so the pipeline runs without Qt. emit() calls every
+    connected callback on the emitting thread; GUI consumers hop threads themselves.'''
+    def __init__(self):
+        self.callbacks = []
+
+    def connect(self, callback):
+        self.callbacks.append(callback)
+
+    def disconnect(self, callback):
+        self.callbacks.remove(callback)
+
+    def emit(self, *args):
+        for callback in self.callbacks:
+            callback(*args)
+
+class LazyModule:
+    '''Module proxy that imports on first attribute access. For heavy dependencies
+    (pandas, httpx) that only some code paths need, so importing the app stays cheap.'''
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+
+    def __getattr__(self, attr):
+        module = importlib.import_module(self._name)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+class FrameClock:
+    '''Caps a consumer at one frame per interval_ms. wait() sleeps out whatever is left of
+    the current frame, so changes arriving meanwhile coalesce into the next one.'''
+    def __init__(self, interval_ms):
+        self.interval = interval_ms / 1000
+        self.last_frame = 0.0
+
+    def wait(self):
+        remaining = self.last_frame + self.interval - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
+        self.last_frame = time.monotonic()
 
 class SharedList:
+    '''Insertion ordered token set. Membership, append and remove are O(1) per item;
+    get() returns a list copy in subscription order.'''
     def __init__(self):
-        self.tokenlist = []
+        self.tokens = {}
         self.lock = threading.Lock()
 
     def get(self):
         with self.lock:
-            return self.tokenlist
+            return list(self.tokens)
+
+    def __contains__(self, item):
+        return item in self.tokens
+
+    def __len__(self):
+        return len(self.tokens)
 
     def append(self, itemList):
         with self.lock:
-            self.tokenlist.extend(itemList)
-    
+            self.tokens.update(dict.fromkeys(itemList))
+
     def remove(self, itemList):
         with self.lock:
-            itemsSet = set(itemList)
-            self.tokenlist = [item for item in self.tokenlist if item not in itemsSet]
\ No newline at end of file
+            for item in itemList:
+                self.tokens.pop(item, None)
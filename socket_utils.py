@@ -1,11 +1,206 @@
 from time import sleep
-from PyQt5.QtCore import  QThread
+from collections import deque
+import asyncio
+import threading
+from Noren import AsyncNorenApi, FeedType
+from shared import FrameClock, TickArray
+
+class FeedApplier(threading.Thread):
+    '''Moves feed frames off the websocket thread. put() only appends to a bounded ring
+    buffer; this thread drains it in batches, merges frames for the same token and
+    applies the batch to feedJson under one lock acquisition.
+
+    No frame is ever dropped: tf/df frames are partial updates, so a lost one would lose
+    its field changes until those fields tick again. Once the ring is full, put() merges
+    frames per token into an overflow map instead (taking every later frame until the
+    map is picked up, so order holds), and the map is applied as soon as the ring is
+    empty. Memory stays bounded by the ring plus one entry per token.'''
+    def __init__(self, feedJson, capacity=65536, batch_size=4096):
+        super().__init__()
+        self.daemon = True
+        self.feedJson = feedJson
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.queue = deque()
+        self.overflow = {}
+        self.overflow_frames = 0
+        self.overflow_lock = threading.Lock()
+        self.ready = threading.Event()
+        self.running = True
+        self.received = 0
+        self.applied = 0
+        self.coalesced = 0
+        self.overflowed = 0
+        self.batches = 0
+        self.max_depth = 0
+        self.frames = {}
+
+    def put(self, message):
+        if self.overflow or len(self.queue) >= self.capacity:
+            with self.overflow_lock:
+                token = message['tk']
+                current = self.overflow.get(token)
+                self.overflow[token] = message if current is None else {**current, **message}
+                self.overflow_frames += 1
+            self.overflowed += 1
+        else:
+            self.queue.append(message)
+        self.received += 1
+        frame_type = message.get('t')
+        self.frames[frame_type] = self.frames.get(frame_type, 0) + 1
+        self.ready.set()
+
+    def run(self):
+        while self.running:
+            self.ready.wait()
+            self.ready.clear()
+            while self.queue or self.overflow:
+                self.apply_batch()
+
+    def apply_batch(self):
+        depth = len(self.queue)
+        if not depth:
+            # ring drained: everything in the overflow map is newer than what was applied
+            with self.overflow_lock:
+                merged, self.overflow = self.overflow, {}
+                frames, self.overflow_frames = self.overflow_frames, 0
+            self.feedJson.write_many(merged.items())
+            self.applied += len(merged)
+            self.coalesced += frames - len(merged)
+            self.batches += 1
+            return
+        if depth > self.max_depth:
+            self.max_depth = depth
+        merged = {}
+        popleft = self.queue.popleft
+        for _ in range(min(depth, self.batch_size)):
+            message = popleft()
+            token = message['tk']
+            if token in merged:
+                merged[token] = {**merged[token], **message}
+                self.coalesced += 1
+            else:
+                merged[token] = message
+        self.feedJson.write_many(merged.items())
+        self.applied += len(merged)
+        self.batches += 1
+
+    def stop(self):
+        self.running = False
+        self.ready.set()
+
+    def stats(self):
+        return {
+            'depth': len(self.queue),
+            'max_depth': self.max_depth,
+            'received': self.received,
+            'applied': self.applied,
+            'coalesced': self.coalesced,
+            'overflowed': self.overflowed,
+            'batches': self.batches,
+            'frames': dict(self.frames),
+        }
+
+class QuoteBootstrap(threading.Thread):
+    '''Seeds the tick store for newly subscribed tokens with one concurrent round of
+    get_quotes, so fresh strikes are filled before their first websocket tick. Tokens
+    written within stale_after seconds are skipped, and seed_many only fills fields such a
+    token has not been sent, so a late quote never overwrites a fresher tick. Tokens that
+    went quiet (unsubscribed, or silent since before a reconnect) are seeded again.'''
+    meta_fields = ('stat', 'request_time', 'token')
+
+    def __init__(self, feedJson, api, concurrency=16, stale_after=30.0):
+        super().__init__()
+        self.daemon = True
+        self.feedJson = feedJson
+        self.api = api
+        self.concurrency = concurrency
+        self.stale_after = stale_after
+        self.client = None
+        self.session = None
+        self.pending = deque()
+        self.ready = threading.Event()
+        self.running = True
+        self.requested = 0
+        self.seeded = 0
+        self.skipped = 0
+        self.failed = 0
+
+    def put(self, tokens):
+        '''tokens are "EXCH|token" keys, a list or the dict ChainMaker.chain_list_ready emits.'''
+        self.pending.append(list(tokens))
+        self.ready.set()
+
+    def run(self):
+        loop = asyncio.new_event_loop()
+        try:
+            while self.running:
+                self.ready.wait()
+                self.ready.clear()
+                while self.pending and self.running:
+                    try:
+                        loop.run_until_complete(self.bootstrap(self.pending.popleft()))
+                    except Exception as e:
+                        print("Error bootstrapping quotes :: {}".format(e))
+            if self.client is not None:
+                loop.run_until_complete(self.client.close())
+        finally:
+            loop.close()
+
+    async def bootstrap(self, keys):
+        by_exchange = {}
+        for key in keys:
+            exchange, token = key.split('|')
+            age = self.feedJson.age(token)
+            if age is None or age > self.stale_after:
+                by_exchange.setdefault(exchange, []).append(token)
+            else:
+                self.skipped += 1
+        if not by_exchange:
+            return
+        session = self.api.session_credentials()
+        if session is None:
+            # nothing to ask with before login; the feed fills these once the socket opens
+            self.failed += sum(len(tokens) for tokens in by_exchange.values())
+            return
+        # a relogin swaps the session token; the pooled client must send the current one
+        if self.client is None:
+            self.client = AsyncNorenApi.from_api(self.api, concurrency=self.concurrency)
+        elif session != self.session:
+            self.client.set_session(*session)
+        self.session = session
+
+        results = await asyncio.gather(*(
+            self.client.get_quotes_many(exchange, tokens) for exchange, tokens in by_exchange.items()
+        ))
+        items = []
+        for quotes in results:
+            for token, quote in quotes.items():
+                tick = {field: value for field, value in quote.items() if field not in self.meta_fields}
+                tick['tk'] = token
+                items.append((token, tick))
+        requested = sum(len(tokens) for tokens in by_exchange.values())
+        self.seeded += self.feedJson.seed_many(items, self.stale_after)
+        self.failed += requested - len(items)
+        self.requested += requested
+
+    def stop(self):
+        self.running = False
+        self.ready.set()
+
+    def stats(self):
+        return {
+            'requested': self.requested,
+            'seeded': self.seeded,
+            'skipped': self.skipped,
+            'failed': self.failed,
+        }
 
 class WebSocketHandler: #(OCStreamer):
     feed_opened = False  
     #def __init__(self):
     #    super().__init__()
-    def __init__(self,subscribed_list,feedJson, orderJson,subscriber, api): #tokenlist,
+    def __init__(self,subscribed_list,feedJson, orderJson,subscriber, api, open_timeout=30): #tokenlist,
         super(WebSocketHandler, self).__init__()
         #self.tokenlist = tokenlist
         self.api = api
@@ -13,10 +208,13 @@ class WebSocketHandler: #(OCStreamer):
         self.feedJson = feedJson
         self.orderJson = orderJson
         self.subscriber = subscriber
+        self.applier = FeedApplier(feedJson)
+        self.opened = threading.Event()
+        self.open_timeout = open_timeout
 
     def event_handler_feed_update(self, message):
         if 'tk' in message:
-            self.feedJson.write(message['tk'], message)
+            self.applier.put(message)
 
     def event_handler_order_update(self, inmessage):
         if 'norenordno' in inmessage and 'status' in inmessage:
@@ -25,51 +223,233 @@ class WebSocketHandler: #(OCStreamer):
     def open_callback(self):
         print("Socket Opened")
         self.feed_opened = True
+        self.opened.set()
         #self.api.subscribe(self.tokenlist.get())
         sub = self.subscribedlist.get()
         #print(f"Sub List :: {sub}")
         self.subscriber.update_newsublist(sub, force_subscribe=True)
 
+    def close_callback(self):
+        self.feed_opened = False
+        self.opened.clear()
+
     def setup_websocket(self):
+        '''Starts the websocket and waits for it to open. Raises TimeoutError, with the
+        socket stopped, when it does not open within open_timeout seconds.'''
+        if not self.applier.is_alive():
+            self.applier.start()
+        self.opened.clear()
         self.api.start_websocket(
             order_update_callback=self.event_handler_order_update,
             subscribe_callback=self.event_handler_feed_update,
-            socket_open_callback=self.open_callback
+            socket_open_callback=self.open_callback,
+            socket_close_callback=self.close_callback
         )
-        sleep(.5)
-        while not self.feed_opened:
-            pass
+        if not self.opened.wait(self.open_timeout):
+            self.close()
+            raise TimeoutError(f"Websocket did not open within {self.open_timeout}s")
+
     def start(self):
         self.setup_websocket()
 
+    def close(self):
+        self.api.close_websocket()
+        self.close_callback()
+
+
+class WSSubscriber(threading.Thread):
+    '''Reference counts subscriptions per consumer (each ChainMaker, the index table).
+    A consumer hands in its whole current token set every time, either a list or a
+    {token: FeedType} dict; the difference against its previous set moves the counts.
+    Tokens going 0 -> 1 are subscribed, tokens dropping back to 0 are unsubscribed, and
+    a token whose wanted feed type changes is moved across (depth if any consumer wants
+    depth, touchline otherwise). Calls without a consumer only ever add. Ticks of an
+    unsubscribed token stop updating, so its feedJson entry is marked stale and the quote
+    bootstrap seeds it again if it comes back.
 
-class WSSubscriber(QThread):
-    def __init__(self,subscribed_list, api): #tokenlist,
+    Nothing is sent from the caller's thread. Changes queue up for coalesce_ms, a
+    subscribe and unsubscribe of the same token and type inside that window cancel out,
+    and run() sends the rest as "#"-joined frames of up to max_frame_tokens tokens and
+    max_frame_bytes, at most
+    max_frames_per_second, holding them while the socket is down.'''
+    coalesce_ms = 100
+    # the 30 tokens per frame the subscriber always sent; larger frames are not known to be accepted
+    max_frame_tokens = 30
+    max_frame_bytes = 2048
+    max_frames_per_second = 10
+    default_feed_type = FeedType.SNAPQUOTE
+
+    def __init__(self,subscribed_list, api, feedJson=None): #tokenlist,
         super(WSSubscriber, self).__init__()
+        self.daemon = True
         #self.tokenlist = tokenlist
         self.api = api
+        self.feedJson = feedJson
+        self.ticks = feedJson.ticks if feedJson is not None else None
         self.subscribedlist = subscribed_list
+        self.consumers = {}
+        self.refcounts = {}
+        self.live = {}
+        self.lock = threading.Lock()
+        self.pending_subscribe = {}
+        self.pending_unsubscribe = {}
+        self.ready = threading.Event()
+        self.running = True
+        self.clock = FrameClock(1000 / self.max_frames_per_second)
+        self.upgrades = 0
+        self.downgrades = 0
+        self.cancelled = 0
+        self.frames_sent = 0
         #self.newsublist = []
 
-    def update_newsublist(self, new_list, force_subscribe= False):
+    def update_newsublist(self, new_list, force_subscribe= False, consumer=None):
         #print("Getting new tokens")
-        if not force_subscribe:
-            new_tokens = self.find_new_items(new_list)
-        else:
-            new_tokens = new_list
-
-        if new_tokens:
-            self.subscribe(new_tokens, force_subscribe=force_subscribe)
-            
-    def find_new_items(self, tokens):
-        subscribed_set = set(self.subscribedlist.get())
-        new_items = [item for item in tokens if item not in subscribed_set]
-        return new_items
-
-    def subscribe(self, tokens, force_subscribe):
-        for i in range(0, len(tokens), 30):
-            tokens_batch = tokens[i:i+30]
-            self.api.subscribe(instrument=tokens_batch)
-            if not force_subscribe:
-                self.subscribedlist.append(tokens_batch)
+        if force_subscribe:
+            # resubscribe after a reconnect at the feed types already live, counts are unchanged
+            with self.lock:
+                self.pending_subscribe = {}
+                self.pending_unsubscribe = {}
+            by_type = {}
+            for token in new_list:
+                by_type.setdefault(self.live.get(token, self.default_feed_type), []).append(token)
+            self.enqueue(by_type, {})
+            return
+
+        if not isinstance(new_list, dict):
+            new_list = dict.fromkeys(new_list, self.default_feed_type)
+        subscribe, unsubscribe = self.update_refcounts(consumer, new_list)
+        for tokens in subscribe.values():
+            if self.ticks is not None:
+                self.ticks.intern(tokens)
+            self.subscribedlist.append(tokens)
+        for tokens in unsubscribe.values():
+            self.subscribedlist.remove(token for token in tokens if token not in self.live)
+        self.enqueue(subscribe, unsubscribe)
+
+    def update_refcounts(self, consumer, wanted):
+        '''Swaps consumer's {token: FeedType} for wanted and returns the (subscribe,
+        unsubscribe) changes needed, each {FeedType: [tokens]}.'''
+        with self.lock:
+            old = self.consumers.get(consumer, {})
+            if consumer is None:
+                wanted = {**old, **wanted}
+            self.consumers[consumer] = wanted
+
+            touched = []
+            for token, feed_type in wanted.items():
+                if token not in old:
+                    self.refcounts[token] = self.refcounts.get(token, 0) + 1
+                    touched.append(token)
+                elif old[token] != feed_type:
+                    touched.append(token)
+            for token in old:
+                if token not in wanted:
+                    count = self.refcounts[token] - 1
+                    if count:
+                        self.refcounts[token] = count
+                    else:
+                        del self.refcounts[token]
+                    touched.append(token)
+
+            subscribe = {}
+            unsubscribe = {}
+            for token in touched:
+                target = self.target_feed_type(token)
+                live = self.live.get(token)
+                if live == target:
+                    continue
+                if live is not None:
+                    unsubscribe.setdefault(live, []).append(token)
+                if target is not None:
+                    subscribe.setdefault(target, []).append(token)
+                    self.live[token] = target
+                    if live is not None:
+                        if target == FeedType.SNAPQUOTE:
+                            self.upgrades += 1
+                        else:
+                            self.downgrades += 1
+                else:
+                    del self.live[token]
+            return subscribe, unsubscribe
+
+    def target_feed_type(self, token):
+        if token not in self.refcounts:
+            return None
+        for tokens in self.consumers.values():
+            if tokens.get(token) == FeedType.SNAPQUOTE:
+                return FeedType.SNAPQUOTE
+        return FeedType.TOUCHLINE
+
+    def enqueue(self, subscribe, unsubscribe):
+        '''Queues {FeedType: [tokens]} changes, cancelling opposite ones still pending.'''
+        with self.lock:
+            for changes, pending, opposite in (
+                (unsubscribe, self.pending_unsubscribe, self.pending_subscribe),
+                (subscribe, self.pending_subscribe, self.pending_unsubscribe),
+            ):
+                for feed_type, tokens in changes.items():
+                    queued = pending.setdefault(feed_type, {})
+                    cancels = opposite.get(feed_type, {})
+                    for token in tokens:
+                        if token in cancels:
+                            del cancels[token]
+                            self.cancelled += 1
+                        else:
+                            queued[token] = None
+        self.ready.set()
+
+    def run(self):
+        while self.running:
+            self.ready.wait()
+            self.ready.clear()
+            sleep(self.coalesce_ms / 1000)
+            while self.running and not self.api.websocket_connected():
+                sleep(0.05)
+            self.flush()
+
+    def flush(self):
+        '''Sends everything pending, unsubscribes first. Tokens that leave the feed
+        entirely are marked stale once their unsubscribe is out.'''
+        with self.lock:
+            unsubscribe, self.pending_unsubscribe = self.pending_unsubscribe, {}
+            subscribe, self.pending_subscribe = self.pending_subscribe, {}
+        for feed_type, tokens in unsubscribe.items():
+            self.send(self.api.unsubscribe, list(tokens), feed_type)
+        if self.feedJson is not None and unsubscribe:
+            with self.lock:
+                dropped = [TickArray.token_of(token) for tokens in unsubscribe.values()
+                           for token in tokens if token not in self.live]
+            self.feedJson.mark_stale(dropped)
+        for feed_type, tokens in subscribe.items():
+            self.send(self.api.subscribe, list(tokens), feed_type)
+
+    def send(self, method, tokens, feed_type):
+        start = 0
+        while start < len(tokens):
+            end = start + 1
+            size = len(tokens[start])
+            while (end < len(tokens) and end - start < self.max_frame_tokens
+                   and size + 1 + len(tokens[end]) <= self.max_frame_bytes):
+                size += 1 + len(tokens[end])
+                end += 1
+            self.clock.wait()
+            method(instrument=tokens[start:end], feed_type=feed_type)
+            self.frames_sent += 1
+            start = end
+
+    def stop(self):
+        self.running = False
+        self.ready.set()
 
+    def stats(self):
+        with self.lock:
+            live = {feed_type.name.lower(): 0 for feed_type in FeedType}
+            for feed_type in self.live.values():
+                live[feed_type.name.lower()] += 1
+            return {
+                **live,
+                'upgrades': self.upgrades,
+                'downgrades': self.downgrades,
+                'cancelled': self.cancelled,
+                'frames_sent': self.frames_sent,
+            }
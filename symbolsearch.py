@@ -1,9 +1,13 @@
+from __future__ import annotations
 import logging
 import os
+import threading
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Union, TypedDict
-from io import BytesIO
 import json
-import pandas as pd
+from shared import LazyModule
 import requests
 import numpy as np
 from typing_extensions import Literal, NewType
@@ -12,7 +16,9 @@ from datetime import datetime, date
 import http.client
 from urllib.parse import urlparse
 import urllib.request
-import httpx
+
+pd = LazyModule('pandas')
+httpx = LazyModule('httpx')
 
 logger = logging.getLogger(__name__)
 #logging.basicConfig(level=logging.DEBUG)
@@ -42,42 +48,145 @@ class LotParams(TypedDict):
     expiry: Union[DateFormat, DateFormat_2, datetime, date]
     tradingsymbol: str
 
-class SearchScrip:   
+class InstrumentRegistry:
+    '''Hash indexes over one exchange symbol master, built once per master load.
+    Resolves contract -> (tradingsymbol, token) and token/tradingsymbol -> row in O(1).'''
+    def __init__(self, df: pd.DataFrame):
+        self.by_contract = {}
+        self.by_token = {}
+        self.by_tsym = {}
+        self.symbols = set()
+        self.lotsize_by_expiry = {}
+        self.lotsize_by_symbol = {}
+
+        n = len(df)
+        def column(name):
+            if name in df.columns:
+                return df[name].to_numpy()
+            return np.full(n, None, dtype=object)
+
+        tokens = column('Token')
+        tsyms = column('TradingSymbol')
+        symbols = column('Symbol')
+        instruments = column('Instrument')
+        expiries = column('Expiry')
+        opt_types = column('OptionType')
+        strikes = column('StrikePrice')
+        lotsizes = column('LotSize')
+
+        for token, tsym, symbol, instrument, expiry, opt_type, strike, lotsize in zip(
+                tokens, tsyms, symbols, instruments, expiries, opt_types, strikes, lotsizes):
+            expiry = self.expiry_key(expiry)
+            row = {'Token': token, 'TradingSymbol': tsym, 'Symbol': symbol, 'Instrument': instrument,
+                   'Expiry': expiry, 'OptionType': opt_type, 'StrikePrice': strike, 'LotSize': lotsize}
+            self.by_contract.setdefault(self.contract_key(symbol, instrument, expiry, strike, opt_type), row)
+            self.by_token.setdefault(str(token), row)
+            self.by_tsym.setdefault(tsym, row)
+            self.symbols.add(symbol)
+            self.lotsize_by_expiry.setdefault((symbol, expiry), lotsize)
+            self.lotsize_by_symbol.setdefault(symbol, lotsize)
+
+    @staticmethod
+    def expiry_key(expiry):
+        return expiry.upper() if isinstance(expiry, str) else None
+
+    @staticmethod
+    def strike_key(strike):
+        try:
+            return float(strike)
+        except (TypeError, ValueError):
+            return None
+
+    @classmethod
+    def contract_key(cls, symbol, instrument, expiry, strike, opt_type):
+        return (symbol, instrument, cls.expiry_key(expiry), cls.strike_key(strike), opt_type)
+
+    def lookup(self, symbol, instrument, expiry, strike, opt_type):
+        return self.by_contract.get(self.contract_key(symbol, instrument, expiry, strike, opt_type))
+
+class StrikeLadder:
+    '''Every listed strike of one underlying and expiry, ascending, with its CE and PE
+    tokens in parallel arrays. Only strikes listed on both sides are kept. Recentering
+    is a binary search plus a slice, so the window size can change at any time.'''
+    def __init__(self, strikes: np.ndarray, ce_tokens: np.ndarray, pe_tokens: np.ndarray):
+        self.strikes = strikes
+        self.ce_tokens = ce_tokens
+        self.pe_tokens = pe_tokens
+
+    def __len__(self):
+        return len(self.strikes)
+
+    def atm_index(self, price: float) -> int:
+        '''Index of the listed strike nearest to price.'''
+        i = int(np.searchsorted(self.strikes, price))
+        if i == len(self.strikes) or (i > 0 and price - self.strikes[i - 1] <= self.strikes[i] - price):
+            i -= 1
+        return i
+
+    def window(self, atm: float, count: int):
+        '''(strikes, ce_tokens, pe_tokens) for count strikes either side of the strike
+        nearest atm, clipped to the listed range.'''
+        i = self.atm_index(atm)
+        lo, hi = max(i - count, 0), min(i + count + 1, len(self.strikes))
+        return self.strikes[lo:hi], self.ce_tokens[lo:hi], self.pe_tokens[lo:hi]
+
+class SearchScrip:
+    master_urls = (
+        "https://api.shoonya.com/{exch}_symbols.txt.zip",
+        "https://shoonya.finvasia.com/{exch}_symbols.txt.zip",
+    )
+    download_headers = {
+        "Cache-Control": "no-cache",
+        "Pragma": "no-cache",
+        "Upgrade-Insecure-Requests": "1",
+    }
+    download_timeout = 30
+    spool_size = 32 * 1024 * 1024
+
     def __init__(self):
         self.symbol_cache = {}
+        self.registry = {}
+        self.ladders = {}
         self.l_path = os.path.dirname(__file__)
         self.config_file = os.path.join(self.l_path, 'search_config.json')
         self.current_date = datetime.now().date()
         self.current_date_str = self.current_date.strftime('%d-%m-%Y')
         self.config_data = {}
+        self.client = None
+        self.client_lock = threading.Lock()
+        self.registry_lock = threading.Lock()
 
     def initialize_symbols(self, exch_list: list, hard_refresh: bool=False):
         self.exch_list = exch_list
-        if not hard_refresh:
-            if os.path.exists(self.config_file):
-                with open(self.config_file, 'r') as file:
-                    self.config_data = json.load(file)
-                for exch in self.exch_list:
-                    if exch in self.config_data and self.config_data[exch] != self.current_date_str:
-                        self.get_symbols(exch=exch, redownload=True)
-                    elif exch not in self.config_data:
-                        self.get_symbols(exch=exch, redownload=True)
-                    else:
-                        self.get_symbols(exch=exch)
-                self.save_config()
-            else:
-                for exch in self.exch_list:
-                    self.get_symbols(exch=exch, redownload=True)
-                self.save_config()
+        if os.path.exists(self.config_file):
+            with open(self.config_file, 'r') as file:
+                self.config_data = json.load(file)
+        if not hard_refresh and self.config_data:
+            redownload = {exch: self.config_data.get(exch) != self.current_date_str for exch in self.exch_list}
         else:
-            for exch in self.exch_list:
-                self.get_symbols(exch=exch, redownload=True)
-            self.save_config()
+            redownload = {exch: True for exch in self.exch_list}
+
+        with ThreadPoolExecutor(max_workers=len(self.exch_list) or 1) as executor:
+            list(executor.map(lambda exch: self.get_symbols(exch=exch, redownload=redownload[exch]), self.exch_list))
+        self.save_config()
                 
     def save_config(self):
         with open(self.config_file, 'w') as file:
             json.dump(self.config_data, file, indent=4)
 
+    def get_client(self) -> httpx.Client:
+        '''One pooled client shared by every master download, created on first use.'''
+        with self.client_lock:
+            if self.client is None:
+                self.client = httpx.Client(http2=True, headers=self.download_headers, timeout=self.download_timeout)
+            return self.client
+
+    def close(self):
+        with self.client_lock:
+            if self.client is not None:
+                self.client.close()
+                self.client = None
+
     def get_symbols(self, 
                     exch: Literal["NSE", "NFO", "MCX", "BSE", "CDS"], 
                     redownload: bool = False) -> pd.DataFrame:
@@ -86,48 +195,205 @@ class SearchScrip:
                 if self.symbol_cache[exch] is not None:
                     return pd.DataFrame(self.symbol_cache[exch])
             else:
-                if os.path.exists(os.path.join(self.l_path, f"{exch}_symbols.csv")):
-                    df = pd.read_csv(f"{exch}_symbols.csv", index_col=None)
+                df = self.load_local_symbols(exch=exch)
+                if df is not None:
                     self.symbol_cache[exch] = df
+                    self.registry.pop(exch, None)
                     return df
-        headers = {
-            "Cache-Control": "no-cache",
-            "Pragma": "no-cache",
-            "Upgrade-Insecure-Requests": "1",
-        }
-        inst_urls = [
-            f"https://api.shoonya.com/{exch}_symbols.txt.zip",
-            f"https://shoonya.finvasia.com/{exch}_symbols.txt.zip"
-        ]
-        for url in inst_urls:
+        df = self.download_symbols(exch=exch)
+        if df is not None:
+            return df
+        return pd.DataFrame()
+
+    def load_local_symbols(self, exch: Literal["NSE", "NFO", "MCX", "BSE", "CDS"], any_day: bool = False) -> Union[pd.DataFrame, None]:
+        df = self.load_columnar_cache(exch=exch, any_day=any_day)
+        if df is None and os.path.exists(os.path.join(self.l_path, f"{exch}_symbols.csv")):
+            df = pd.read_csv(f"{exch}_symbols.csv", index_col=None)
+            self.save_columnar_cache(exch=exch, df=df)
+        return df
+
+    def read_master_zip(self, fileobj) -> pd.DataFrame:
+        with zipfile.ZipFile(fileobj) as archive:
+            with archive.open(archive.namelist()[0]) as member:
+                return pd.read_csv(member, index_col=None)
+
+    def download_symbols(self, exch: Literal["NSE", "NFO", "MCX", "BSE", "CDS"]) -> Union[pd.DataFrame, None]:
+        '''Conditional GET against each mirror using the ETag/Last-Modified saved in
+        search_config.json. The body is spooled to a temp file and decompressed as a
+        stream; a 304 reuses the local copy.'''
+        validators = self.config_data.setdefault("validators", {})
+        for url_template in self.master_urls:
+            url = url_template.format(exch=exch)
             try:
-                #cookies = requests.cookies.RequestsCookieJar()
-                #headers = {
-                #    "Cache-Control": "no-cache",
-                #    "Pragma": "no-cache"
-                #    }
-                #res = requests.get(url, headers=headers, cookies=cookies,allow_redirects=True)
-               
-                with httpx.Client(http2=True,headers=headers) as client:
-                    res = client.get(url)
-                    res.raise_for_status() 
-                    df = pd.read_csv(BytesIO(res.content), compression="zip")
-                    self.symbol_cache[exch] = df
+                headers = {}
+                saved = validators.get(url, {})
+                if saved and self.has_local_symbols(exch=exch):
+                    if saved.get("etag"):
+                        headers["If-None-Match"] = saved["etag"]
+                    if saved.get("last_modified"):
+                        headers["If-Modified-Since"] = saved["last_modified"]
+
+                with self.get_client().stream("GET", url, headers=headers) as res:
+                    if res.status_code == 304:
+                        logger.debug(f"{exch} master not modified")
+                        df = self.load_local_symbols(exch=exch, any_day=True)
+                        if df is None:
+                            validators.pop(url, None)
+                            continue
+                        downloaded = False
+                    else:
+                        res.raise_for_status()
+                        with tempfile.SpooledTemporaryFile(max_size=self.spool_size) as spool:
+                            for chunk in res.iter_bytes():
+                                spool.write(chunk)
+                            spool.seek(0)
+                            df = self.read_master_zip(spool)
+                        downloaded = True
+                    fresh = {"etag": res.headers.get("ETag"), "last_modified": res.headers.get("Last-Modified")}
+                    validators[url] = {**saved, **{k: v for k, v in fresh.items() if v}}
+
+                self.symbol_cache[exch] = df
+                self.registry.pop(exch, None)
+                if downloaded:
                     df.to_csv(f"{exch}_symbols.csv", index=None)
-                    self.config_data[exch] = self.current_date_str
-                    return df
-            except (httpx.RequestError, Exception) as e:
-            #except (requests.exceptions.RequestException, Exception) as e:
+                self.save_columnar_cache(exch=exch, df=df)
+                self.config_data[exch] = self.current_date_str
+                return df
+            except (httpx.HTTPError, Exception) as e:
                 logger.debug(e)
                 continue
-        return pd.DataFrame()
+
+    def has_local_symbols(self, exch: Literal["NSE", "NFO", "MCX", "BSE", "CDS"]) -> bool:
+        return (os.path.exists(os.path.join(self.columnar_cache_dir(exch=exch), "meta.json"))
+                or os.path.exists(os.path.join(self.l_path, f"{exch}_symbols.csv")))
+
+    def columnar_cache_dir(self, exch: Literal["NSE", "NFO", "MCX", "BSE", "CDS"]) -> str:
+        return os.path.join(self.l_path, f"{exch}_symbols.cache")
+
+    def save_columnar_cache(self, exch: Literal["NSE", "NFO", "MCX", "BSE", "CDS"], df: pd.DataFrame):
+        '''One .npy file per column plus meta.json, written last so a partial cache is never read.
+        String columns are dictionary encoded: unique values plus int32 codes (-1 is null).'''
+        cache_dir = self.columnar_cache_dir(exch=exch)
+        meta_file = os.path.join(cache_dir, "meta.json")
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            if os.path.exists(meta_file):
+                os.remove(meta_file)
+            columns = []
+            for i, col in enumerate(df.columns):
+                values = df[col].to_numpy()
+                string = values.dtype == object
+                if string:
+                    codes, uniques = pd.factorize(values, use_na_sentinel=True)
+                    np.save(os.path.join(cache_dir, f"{i}.codes.npy"), codes.astype(np.int32), allow_pickle=False)
+                    values = np.array([str(v) for v in uniques], dtype=str)
+                np.save(os.path.join(cache_dir, f"{i}.npy"), values, allow_pickle=False)
+                columns.append({"name": col, "string": bool(string)})
+            with open(meta_file, 'w') as file:
+                json.dump({"date": self.current_date_str, "rows": len(df), "columns": columns}, file)
+        except Exception as e:
+            logger.debug("Error writing symbol cache :: {}".format(e))
+
+    def load_columnar_cache(self, exch: Literal["NSE", "NFO", "MCX", "BSE", "CDS"], any_day: bool = False) -> Union[pd.DataFrame, None]:
+        '''Memory-maps the columns saved by save_columnar_cache. Returns None when the cache
+        is missing or, unless any_day is set, belongs to another trading day.'''
+        cache_dir = self.columnar_cache_dir(exch=exch)
+        try:
+            with open(os.path.join(cache_dir, "meta.json"), 'r') as file:
+                meta = json.load(file)
+            if not any_day and meta["date"] != self.current_date_str:
+                return None
+            data = {}
+            for i, col in enumerate(meta["columns"]):
+                values = np.load(os.path.join(cache_dir, f"{i}.npy"), mmap_mode='r', allow_pickle=False)
+                if col["string"]:
+                    codes = np.load(os.path.join(cache_dir, f"{i}.codes.npy"), mmap_mode='r')
+                    values = np.append(values.astype(object), np.nan).take(codes)
+                data[col["name"]] = values
+            df = pd.DataFrame(data, copy=False)
+            if len(df) != meta["rows"]:
+                return None
+            return df
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.debug("Error reading symbol cache :: {}".format(e))
+            return None
+
+    def get_registry(self, exch: Literal["NSE", "NFO", "MCX", "BSE", "CDS"]) -> InstrumentRegistry:
+        if exch not in self.registry:
+            with self.registry_lock:
+                if exch not in self.registry:
+                    self.registry[exch] = InstrumentRegistry(self.get_symbols(exch=exch))
+        return self.registry[exch]
+
+    def get_strike_ladder(self,
+                          symbol: str,
+                          expiry: Union[DateFormat, DateFormat_2, date, datetime],
+                          exch: Literal['NFO','CDS','MCX']='NFO',
+                          instrument: str=None) -> Union[StrikeLadder, None]:
+        '''Full strike ladder of symbol for expiry, built from the symbol master once and
+        kept on disk for the trading day so a restart loads it without touching the master.'''
+        instrument = instrument or self.default_instrument(exch)
+        exp = self.format_date(date_obj=expiry)
+        key = (exch, symbol, instrument, exp)
+        if key in self.ladders:
+            return self.ladders[key]
+        ladder_file = os.path.join(self.l_path, f"{exch}_ladders.cache", f"{symbol}_{instrument}_{exp}.npz")
+        ladder = self.load_strike_ladder(ladder_file)
+        if ladder is None:
+            try:
+                ladder = self.build_strike_ladder(self.get_symbols(exch=exch), symbol, instrument, exp)
+                self.save_strike_ladder(ladder_file, ladder)
+            except Exception as e:
+                logger.debug("Error building strike ladder :: {}".format(e))
+                return None
+        self.ladders[key] = ladder
+        return ladder
+
+    @staticmethod
+    def build_strike_ladder(df: pd.DataFrame, symbol: str, instrument: str, exp: DateFormat_2) -> StrikeLadder:
+        mask = ((df['Symbol'] == symbol) & (df['Instrument'] == instrument)
+                & (df['Expiry'].astype(str).str.upper() == exp))
+        contracts = df.loc[mask, ['StrikePrice', 'OptionType', 'Token']]
+        sides = {}
+        for opt_type in ('CE', 'PE'):
+            side = contracts[contracts['OptionType'] == opt_type]
+            sides[opt_type] = pd.Series(side['Token'].astype(str).to_numpy(),
+                                        index=side['StrikePrice'].astype(float).to_numpy())
+            sides[opt_type] = sides[opt_type][~sides[opt_type].index.duplicated()]
+        strikes = sides['CE'].index.intersection(sides['PE'].index).sort_values()
+        return StrikeLadder(strikes.to_numpy(dtype=float),
+                            sides['CE'].loc[strikes].to_numpy(dtype=str),
+                            sides['PE'].loc[strikes].to_numpy(dtype=str))
+
+    def save_strike_ladder(self, ladder_file: str, ladder: StrikeLadder):
+        try:
+            os.makedirs(os.path.dirname(ladder_file), exist_ok=True)
+            with open(ladder_file, 'wb') as file:
+                np.savez(file, date=np.array(self.current_date_str), strikes=ladder.strikes,
+                         ce_tokens=ladder.ce_tokens, pe_tokens=ladder.pe_tokens)
+        except Exception as e:
+            logger.debug("Error writing strike ladder :: {}".format(e))
+
+    def load_strike_ladder(self, ladder_file: str) -> Union[StrikeLadder, None]:
+        try:
+            with np.load(ladder_file, allow_pickle=False) as data:
+                if str(data['date']) != self.current_date_str:
+                    return None
+                return StrikeLadder(data['strikes'], data['ce_tokens'], data['pe_tokens'])
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.debug("Error reading strike ladder :: {}".format(e))
+            return None
 
     #@lru_cache(maxsize=None)
     def get_expiry(self,
                    exch: Literal['NFO','CDS','MCX']='NFO',
                    instrument: Literal['FUTIDX', 'FUTSTK', 'OPTIDX', 'OPTSTK', 'FUTCOM', 'OPTFUT', 'OPTCUR', 'FUTCUR']= 'OPTIDX',
                     symbol: str=None,
-                    expiry: Literal['current', 'next', 'far', 'recent_list']= 'current'
+                    expiry: Literal['current', 'next', 'far', 'monthly', 'recent_list']= 'current'
                     ) -> Union[datetime, List[datetime]]:
 
         if exch == 'MCX' and instrument == 'OPTIDX':
@@ -153,6 +419,10 @@ class SearchScrip:
                 return filtered_expiry_list[1]
             elif expiry == 'far':
                 return filtered_expiry_list[2]
+            elif expiry == 'monthly':
+                current = filtered_expiry_list[0]
+                return [date for date in filtered_expiry_list
+                        if (date.year, date.month) == (current.year, current.month)][-1]
             elif expiry == 'recent_list':
                 if instrument == 'OPTIDX':
                     return filtered_expiry_list[:4]
@@ -188,9 +458,46 @@ class SearchScrip:
         else:
             logger.info("Invalid Date Format")
 
+    def default_instrument(self, exch: Literal['NSE','NFO','BSE','CDS','MCX']) -> str:
+        if exch == 'NFO':
+            return 'OPTIDX'
+        elif exch == 'NSE':
+            return 'EQ'
+        elif exch == 'MCX':
+            return 'OPTIDX'
+        elif exch == 'BSE':
+            return 'A'
+        elif exch == 'CDS':
+            return 'OPTCUR'
+
     def search_scrip(self,
                      exch: Literal['NSE','NFO','BSE','CDS','MCX']='NFO',
                      **kwargs: ScripParams) -> Union[str, tuple, dict]:
+        '''Resolves fully specified contracts and tradingsymbols from the registry,
+        anything else falls back to query_scrip.'''
+        try:
+            registry = self.get_registry(exch=exch)
+            trading_symbol = kwargs.get('tradingsymbol')
+            if trading_symbol is not None:
+                row = registry.by_tsym.get(trading_symbol)
+                if row is not None:
+                    return row['Token']
+            elif all(kwargs.get(key) is not None for key in ('symbol', 'expiry', 'strikeprice', 'optiontype')):
+                instrument = kwargs.get('instrument') or self.default_instrument(exch)
+                row = registry.lookup(symbol=kwargs['symbol'],
+                                      instrument=instrument,
+                                      expiry=self.format_date(date_obj=kwargs['expiry']),
+                                      strike=kwargs['strikeprice'],
+                                      opt_type=kwargs['optiontype'])
+                if row is not None:
+                    return row['TradingSymbol'], row['Token']
+        except Exception as e:
+            logger.debug("Error :: {}".format(e))
+        return self.query_scrip(exch=exch, **kwargs)
+
+    def query_scrip(self,
+                    exch: Literal['NSE','NFO','BSE','CDS','MCX']='NFO',
+                    **kwargs: ScripParams) -> Union[str, tuple, dict]:
         try:
             if 'expiry' in kwargs:
                 expiry = kwargs['expiry']
@@ -203,16 +510,7 @@ class SearchScrip:
             trading_symbol = kwargs.get('tradingsymbol')
             if trading_symbol is None:
                 if instrument is None:
-                    if exch == 'NFO':
-                        instrument = 'OPTIDX'
-                    elif exch == 'NSE':
-                        instrument = 'EQ'
-                    elif exch == 'MCX':
-                        instrument = 'OPTIDX'
-                    elif exch == 'BSE':
-                        instrument = 'A'
-                    elif exch == 'CDS':
-                        instrument = 'OPTCUR'
+                    instrument = self.default_instrument(exch)
 
                 query_parts = []
                 for key, value in kwargs.items():
@@ -310,25 +608,25 @@ class SearchScrip:
                     exch: Literal['NFO','CDS','MCX']='NFO',
                     **kwargs: LotParams) -> int:
 
-        sym_df = self.get_symbols(exch=exch)
+        registry = self.get_registry(exch=exch)
         symbol = kwargs.get('symbol')
         trading_symbol = kwargs.get('tradingsymbol')
 
         try:
             if trading_symbol is not None:
-                return sym_df.query(f"TradingSymbol in ['{trading_symbol}']")['LotSize'].iloc[0]
+                return registry.by_tsym[trading_symbol]['LotSize']
             elif symbol is not None:
                 if 'expiry' in kwargs:
                     expiry = kwargs['expiry']
                     exp = self.format_date(date_obj=expiry)
-                    return sym_df.query(f"Symbol in ['{symbol}'] and Expiry in ['{exp}']")['LotSize'].iloc[0]
+                    return registry.lotsize_by_expiry[(symbol, registry.expiry_key(exp))]
                 else:
-                    try:
-                        expiry = self.get_expiry(exch=exch,symbol=symbol)
-                        exp = self.format_date(date_obj=expiry)
-                        return sym_df.query(f"Symbol in ['{symbol}'] and Expiry in ['{exp}']")['LotSize'].iloc[0]
-                    except:
-                        return sym_df.query(f"Symbol in ['{symbol}']")['LotSize'].iloc[0]
+                    expiry = self.get_expiry(exch=exch,symbol=symbol)
+                    exp = self.format_date(date_obj=expiry) if expiry is not None else None
+                    lotsize = registry.lotsize_by_expiry.get((symbol, registry.expiry_key(exp)))
+                    if lotsize is None:
+                        lotsize = registry.lotsize_by_symbol[symbol]
+                    return lotsize
             else:
                 print("Check parameters.")
         except Exception as e:
@@ -338,13 +636,11 @@ class SearchScrip:
         try:
             if tradingsymbol is not None:
                 for exch in self.exch_list:
-                    sym_df = self.get_symbols(exch=exch)
-                    if tradingsymbol in sym_df['TradingSymbol'].values:
+                    if tradingsymbol in self.get_registry(exch=exch).by_tsym:
                         return exch
             elif symbol is not None:
                 for exch in self.exch_list:
-                    sym_df = self.get_symbols(exch=exch)
-                    if symbol in sym_df['Symbol'].values:
+                    if symbol in self.get_registry(exch=exch).symbols:
                         return exch
             else:
                 print("Provide either tradingsymbol or symbol ")
@@ -372,13 +668,13 @@ class SearchScrip:
                     token: Union[int, float]= None,
                     tradingsymbol: str=None) :
         try:
-            sym_df = self.get_symbols(exch=exch)
-            
+            registry = self.get_registry(exch=exch)
+
             if token is not None:
-                values = sym_df.query(f"Token in ['{token}']")[['StrikePrice','OptionType']].iloc[0]
+                values = registry.by_token[str(token)]
                 return {str(token):{'StrikePrice': values['StrikePrice'], 'OptionType': values['OptionType']}}
             if tradingsymbol is not None:
-                values = sym_df.query(f"TradingSymbol in ['{tradingsymbol}']")[['Token','StrikePrice','OptionType']].iloc[0]
+                values = registry.by_tsym[tradingsymbol]
                 return {values['Token']: {'StrikePrice': values['StrikePrice'], 'OptionType': values['OptionType']}}
         except Exception as e:
             logger.debug("Error fetching strikediff :: {}".format(e))
@@ -1,22 +1,36 @@
-from PyQt5.QtCore import QThread, pyqtSignal
+from shared import FrameClock, Signal, TICK_FIELDS
+from Noren import FeedType
+import numpy as np
 import threading
 import time
 
-class IndexTableDataFetcher(QThread):
-    table_data_ready = pyqtSignal(object)
-
+class IndexTableDataFetcher(threading.Thread):
     def __init__(self, feedJson, index_keys, update_freq=500):
+        '''update_freq is the minimum time between frames in ms.'''
         super(IndexTableDataFetcher, self).__init__()
+        self.daemon = True
+        self.table_data_ready = Signal()
         self.feedJson = feedJson
         self.index_keys = index_keys
         self.update_freq = update_freq
+        self.running = True
 
     def run(self):
-        while True:
+        clock = FrameClock(self.update_freq)
+        seen_version = -1
+        while self.running:
+            version = self.feedJson.wait_for_change(seen_version)
+            if version == seen_version:
+                continue
+            clock.wait()
             data = self.feedJson.get()
+            seen_version = data.version
             table_data = self.get_table_data(data)
             self.table_data_ready.emit(table_data)
-            self.msleep(self.update_freq) 
+
+    def stop(self):
+        self.running = False
+        self.feedJson.wake()
     
     def get_table_data(self, data):
         table_data = []
@@ -47,199 +61,307 @@ class IndexTableDataFetcher(QThread):
                 ])
         return table_data
 
-class OptionChainDataFetcher(QThread):
-    table_data_ready = pyqtSignal(list)
+class OptionChainDataFetcher(threading.Thread):
+    '''Rows hold floats straight from the TickArray, '' for fields not received yet and
+    None for an unknown change; OptionChainTableModel formats them for display.
+    After the first build of a chain only rows whose CE or PE token ticked since the
+    last cycle are rebuilt, and an idle cycle emits nothing. When more than
+    full_rebuild_share of the rows changed, the whole chain is rebuilt instead.'''
+    change_columns = (6, 10)
+    full_rebuild_share = 0.25
+    # build_rows lays out CE fields, PE fields, strike, CE change, PE change; this is the table order
+    _ce = {field: i for i, field in enumerate(TICK_FIELDS)}
+    _pe = {field: i + len(TICK_FIELDS) for i, field in enumerate(TICK_FIELDS)}
+    row_columns = np.array([
+        _ce['l'], _ce['h'], _ce['o'], _ce['v'], _ce['oi'], _ce['poi'], 2 * len(TICK_FIELDS) + 1, _ce['lp'],
+        2 * len(TICK_FIELDS),
+        _pe['lp'], 2 * len(TICK_FIELDS) + 2, _pe['poi'], _pe['oi'], _pe['v'], _pe['o'], _pe['h'], _pe['l'],
+    ])
+    del _ce, _pe
 
-    def __init__(self, feed_json, update_freq = 500):
+    def __init__(self, feed_json, update_freq = 500, expiry = None):
+        '''update_freq is the minimum time between frames in ms, expiry picks this table's
+        chain out of ChainMaker.chains_ready.'''
         super(OptionChainDataFetcher, self).__init__()
+        self.daemon = True
+        self.table_data_ready = Signal()
         self.feed_json = feed_json
+        self.expiry = expiry
+        self.ticks = feed_json.ticks
         self.token_dict = {}
         self.strike_prices = []
+        self.chain = None
+        self.built_chain = None
+        self.table = []
+        self.seen_version = -1
         self.update_freq = update_freq
+        self.running = True
 
     def run(self):
-        while True:
-            data = self.feed_json.get()
-            table_data = self.get_table_data(data)
+        clock = FrameClock(self.update_freq)
+        feed_version = -1
+        while self.running:
+            version = self.feed_json.wait_for_change(feed_version)
+            if version == feed_version and self.chain is self.built_chain:
+                continue
+            feed_version = version
+            clock.wait()
+            table_data = self.get_table_data()
             if table_data:
                 self.table_data_ready.emit(table_data)
-            self.msleep(self.update_freq)
 
-    def get_table_data(self, data):
-        table_data = []
-        if self.token_dict:
-            for strike_price in self.strike_prices:
-                option_list = self.token_dict[strike_price]
+    def stop(self):
+        self.running = False
+        self.feed_json.wake()
 
-                ce_token_data = option_list[0]
-                pe_token_data = option_list[1]
+    def get_table_data(self):
+        chain = self.chain
+        if chain is None:
+            return None
+        strikes, ce_slots, pe_slots, row_of_slot = chain
+        version = self.ticks.version
 
-                ce_token = ce_token_data['token']
-                pe_token = pe_token_data['token']
+        if chain is self.built_chain:
+            if version == self.seen_version:
+                return None
+            changed = self.ticks.changed_since(self.seen_version).tolist()
+            rows = sorted({row_of_slot[slot] for slot in changed if slot in row_of_slot})
+            self.seen_version = version
+            if not rows:
+                return None
+            if len(rows) > self.full_rebuild_share * len(strikes):
+                table = self.build_rows(strikes, ce_slots, pe_slots)
+            else:
+                table = list(self.table)
+                for row, row_data in zip(rows, self.build_changed_rows(strikes[rows], ce_slots[rows], pe_slots[rows])):
+                    table[row] = row_data
+        else:
+            table = self.build_rows(strikes, ce_slots, pe_slots)
+            self.built_chain = chain
+            self.seen_version = version
 
-                ce_data = data.get(str(ce_token), {})
-                pe_data = data.get(str(pe_token), {})
+        self.table = table
+        return table
 
-                ce_ltp = ce_data.get('lp', '')
-                ce_close = ce_data.get('c', '')
-                ce_open = ce_data.get('o', '')
-                ce_high = ce_data.get('h', '')
-                ce_low = ce_data.get('l', '')
-                ce_change = None
+    def build_rows(self, strikes, ce_slots, pe_slots):
+        '''Rows for the given strikes in one vectorized pass: CE and PE ticks are read
+        together, laid side by side with the strike and both changes, and row_columns picks
+        the table order. Only fields not received yet are patched in Python.'''
+        n = len(strikes)
+        width = len(TICK_FIELDS)
+        fields = self.ticks.read(np.concatenate((ce_slots, pe_slots))).view(np.float64).reshape(2, n, width)
+        wide = np.empty((n, 2 * width + 3))
+        wide[:, :width] = fields[0]
+        wide[:, width:2 * width] = fields[1]
+        wide[:, -3] = strikes
+        # lp - c for CE and PE
+        wide[:, -2:] = (fields[:, :, TICK_FIELDS.index('lp')] - fields[:, :, TICK_FIELDS.index('c')]).round(2).T
+        table = wide[:, self.row_columns]
+        rows = table.tolist()
+        missing = np.isnan(table)
+        if missing.any():
+            for row, column in np.argwhere(missing).tolist():
+                rows[row][column] = None if column in self.change_columns else ''
+        return rows
 
-                if ce_ltp and ce_close:
-                    try:
-                        ce_ltp_value = float(ce_ltp)
-                        ce_close_value = float(ce_close)
-                        ce_change = round((ce_ltp_value - ce_close_value),2)
-                    except ValueError:
-                        pass
-                                    
-                pe_ltp = pe_data.get('lp', '')
-                pe_close = pe_data.get('c', '')
-                pe_open = pe_data.get('o', '')
-                pe_high = pe_data.get('h', '')
-                pe_low = pe_data.get('l', '')
-                pe_change = None
-                
+    def build_changed_rows(self, strikes, ce_slots, pe_slots):
+        '''Same rows as build_rows, one strike at a time. For a handful of rows this beats
+        the fixed cost of the vectorized pass.'''
+        rows = []
+        for strike, ce, pe in zip(strikes.tolist(), self.ticks.read(ce_slots).tolist(), self.ticks.read(pe_slots).tolist()):
+            ce_ltp, ce_close, ce_open, ce_high, ce_low, ce_vol, ce_oi, ce_poi = ce[:8]
+            pe_ltp, pe_close, pe_open, pe_high, pe_low, pe_vol, pe_oi, pe_poi = pe[:8]
+            ce_change = ce_ltp - ce_close
+            pe_change = pe_ltp - pe_close
+            row = ['' if value != value else value for value in (
+                ce_low, ce_high, ce_open, ce_vol, ce_oi, ce_poi, ce_change, ce_ltp,
+                strike,
+                pe_ltp, pe_change, pe_poi, pe_oi, pe_vol, pe_open, pe_high, pe_low,
+            )]
+            row[6] = None if ce_change != ce_change else round(ce_change, 2)
+            row[10] = None if pe_change != pe_change else round(pe_change, 2)
+            rows.append(row)
+        return rows
 
-                if pe_ltp and pe_close:
-                    try:
-                        pe_ltp_value = float(pe_ltp)
-                        pe_close_value = float(pe_close)
-                        pe_change = round((pe_ltp_value - pe_close_value),2)
-                    except ValueError:
-                        pass
-                
-                table_data.append([
-                    ce_low,
-                    ce_high,
-                    ce_open,
-                    ce_data.get('v', ''),
-                    ce_data.get('oi', ''),
-                    ce_data.get('poi', ''),
-                    ce_change,
-                    ce_ltp,
-                    strike_price,
-                    pe_ltp,
-                    pe_change,
-                    pe_data.get('poi', ''),
-                    pe_data.get('oi', ''),
-                    pe_data.get('v', ''),
-                    pe_open,
-                    pe_high,
-                    pe_low
-                ])
-            return table_data
+    def process_chains(self, chains):
+        token_dict = chains.get(self.expiry)
+        if token_dict is not None:
+            self.process_token_dict(token_dict)
 
     def process_token_dict(self, token_dict):
-        self.strike_prices = sorted(token_dict.keys())
+        strike_prices = sorted(token_dict.keys())
+        ce_slots = self.ticks.intern(token_dict[strike][0]['token'] for strike in strike_prices)
+        pe_slots = self.ticks.intern(token_dict[strike][1]['token'] for strike in strike_prices)
+        row_of_slot = {slot: row for row, slot in enumerate(ce_slots.tolist())}
+        row_of_slot.update({slot: row for row, slot in enumerate(pe_slots.tolist())})
+        self.strike_prices = strike_prices
         self.token_dict = token_dict
+        self.chain = (np.array(strike_prices, dtype=float), ce_slots, pe_slots, row_of_slot)
+        self.feed_json.wake()
         
     
 
-class ChainMaker(QThread):
-    chain_list_ready = pyqtSignal(object)
-    tokendict_ready = pyqtSignal(object)
-    atmstrike_ready = pyqtSignal(object)
-
-    def __init__(self, api, sc, feedJson, indices, symbol, no_of_strikes, update_freq = 500):
+class ChainMaker(threading.Thread):
+    def __init__(self, api, sc, feedJson, indices, symbol, no_of_strikes, update_freq = 500, depth_strikes = 2,
+                 hysteresis = 0.1, dwell_ms = 1000, expiries = ('current',)):
+        '''Strikes within depth_strikes of the ATM are streamed with depth (snapquote), the
+        rest of the ladder with touchline. The chain recenters only once the index has
+        stayed more than hysteresis * strikediff past the strike midpoint for dwell_ms.
+        expiries ('current', 'next', 'monthly', ...) all follow the same spot read and ATM;
+        ones resolving to the same date are streamed once.'''
         super(ChainMaker, self).__init__()
+        self.daemon = True
+        self.chain_list_ready = Signal()
+        self.chains_ready = Signal()
+        self.atmstrike_ready = Signal()
         self.symbol = symbol
         self.strikes_count = no_of_strikes
+        self.depth_strikes = depth_strikes
+        self.hysteresis = hysteresis
+        self.dwell_ms = dwell_ms
+        self.atm_strike = None
+        self.lr = self.ur = None
+        self.breach_since = None
+        self.breaches = 0
+        self.suppressed = 0
+        self.recenters = 0
         self.api = api
         self.sc = sc
         self.indices = indices
         self.feedJson = feedJson
         self.sym_token = self.indices[self.symbol.lower()]
+        self.feedJson.ticks.intern([f"NSE|{self.sym_token}"])
         self.strikediff = self.sc.get_strikediff(symbol=symbol)
         self.exchange = self.sc.get_exchange(symbol=self.symbol)
         #if self.exchange == None:
         #    self.exchange = self.sc.get_exchange(tradingsymbol=self.symbol)
         #print(self.exchange)
-        self.expiry = self.sc.get_expiry(exch= self.exchange,symbol= symbol)
+        resolved = {expiry: self.sc.get_expiry(exch= self.exchange,symbol= symbol, expiry= expiry) for expiry in expiries}
+        unresolved = [expiry for expiry, date in resolved.items() if date is None]
+        if unresolved:
+            print(f"{self.symbol} :: No {', '.join(unresolved)} expiry listed, skipped")
+        self.expiries = list(dict.fromkeys(date for date in resolved.values() if date is not None))
+        if not self.expiries:
+            raise ValueError(f"{self.symbol} :: None of the expiries {', '.join(expiries)} is listed")
+        self.expiry = self.expiries[0]
         #if self.expiry == None:
         #    self.expiry = self.sc.get_expiry(exch= self.exchange,tradingsymbol= symbol)
+        self.ladders = {
+            expiry: self.sc.get_strike_ladder(symbol=symbol, expiry=expiry, exch=self.exchange)
+            for expiry in self.expiries
+        }
         self.update_freq = update_freq
-        print(f"{self.symbol} :: {self.expiry}")
+        self.resized = False
+        self.running = True
+        print(f"{self.symbol} :: {', '.join(str(expiry) for expiry in self.expiries)}")
     
     def get_atm_strike(self, ltp):
         return round(ltp/self.strikediff)*self.strikediff
     
     def get_range(self, atm):
-        range = (self.strikediff)/2
+        range = (self.strikediff)/2 + self.hysteresis*self.strikediff
         lower_range = atm - range
         upper_range = atm + range
         return lower_range, upper_range
-    
-    def run(self):
-        first_run = True
-        while True:
-            lp = self.feedJson.read(self.sym_token)
-            if lp is not None:
-                ltp = float(lp["lp"])
-                if first_run:
-                    atm_strike = self.get_atm_strike(ltp)
-                    self.atmstrike_ready.emit(atm_strike)
-                    lr, ur = self.get_range(atm_strike)
-                    #print(f"   {self.symbol} :: ATM :: {atm_strike} LR :: {lr} UR :: {ur}")
-                    strikes = self.get_strikelist(atm_strike)
-                    self.get_tokens(strikes)
-                    first_run = False
-                elif ur < ltp or  ltp < lr:
-                    #print(f"   {self.symbol} :: Range Breached :: LR :: {lr} UR :: {ur}")
-                    atm_strike = self.get_atm_strike(ltp)
-                    self.atmstrike_ready.emit(atm_strike)
-                    lr, ur = self.get_range(atm_strike)
-                    #print(f"{self.symbol} :: ATM :: {atm_strike} LR :: {lr} UR :: {ur}")
-                    strikes = self.get_strikelist(atm_strike)
-                    self.get_tokens(strikes)
-            self.msleep(self.update_freq)
-    
-    def get_strikelist(self, atm_strike):
-        options = ["CE", "PE"]
 
-        option_list = []
-        try:
-            for opt in options:
-                strike_prices = [atm_strike + (i * self.strikediff) for i in range(self.strikes_count, 0, -1)]
-                strike_prices += [atm_strike]
-                strike_prices += [atm_strike - (i * self.strikediff) for i in range(1, self.strikes_count + 1)]
+    def check_breach(self, ltp, now):
+        '''True once ltp has stayed outside the band for dwell_ms. A breach that comes back
+        inside before that is dropped and counted as suppressed.'''
+        if self.lr <= ltp <= self.ur:
+            if self.breach_since is not None:
+                self.breach_since = None
+                self.suppressed += 1
+            return False
+        if self.breach_since is None:
+            self.breach_since = now
+            self.breaches += 1
+        return (now - self.breach_since) * 1000 >= self.dwell_ms
+
+    def recenter(self, ltp):
+        atm_strike = self.get_atm_strike(ltp)
+        self.atm_strike = atm_strike
+        self.atmstrike_ready.emit(atm_strike)
+        self.lr, self.ur = self.get_range(atm_strike)
+        #print(f"{self.symbol} :: ATM :: {atm_strike} LR :: {self.lr} UR :: {self.ur}")
+        self.breach_since = None
+        self.recenters += 1
+        self.emit_window()
+
+    def run(self):
+        clock = FrameClock(self.update_freq)
+        sym_slot = self.feedJson.ticks.slot(self.sym_token)
+        seen_stamp = -1
+        version = -1
+        while self.running:
+            timeout = None
+            if self.breach_since is not None:
+                # wake up when the dwell runs out even if the index stops ticking
+                timeout = max(self.breach_since + self.dwell_ms / 1000 - time.monotonic(), 0)
+            # wait_for_change, plus the resized flag checked under the same condition
+            # set_strikes_count sets it under, so a resize cannot slip past the wait
+            with self.feedJson.changed:
+                if self.feedJson.version == version and not self.resized:
+                    self.feedJson.changed.wait(timeout)
+                version = self.feedJson.version
+                resized, self.resized = self.resized, False
+            if resized and self.atm_strike is not None:
+                self.emit_window()
+            stamp = self.feedJson.ticks.stamps[sym_slot]
+            if stamp == seen_stamp and self.breach_since is None:
+                continue
+            seen_stamp = stamp
+            clock.wait()
+            ltp = self.feedJson.ticks.value(self.sym_token, 'lp')
+            if ltp is None:
+                continue
+            if self.atm_strike is None or self.check_breach(ltp, time.monotonic()):
+                self.recenter(ltp)
 
-                opt_list = [
-                    {"strikeprice": strike, "optiontype": opt, "expiry": self.expiry, "symbol": self.symbol}
-                    for strike in strike_prices
-                ]
+    def stats(self):
+        return {'breaches': self.breaches, 'suppressed': self.suppressed, 'recenters': self.recenters}
 
-                option_list += opt_list
-            #print(option_list)
-            return option_list
-        except Exception as e:
-            print("Error constructing strike list :: {}".format(e))
+    def stop(self):
+        self.running = False
+        self.feedJson.wake()
     
-    def get_tokens(self, strikes):
-        tokenlist = []
-        tokendict = {}
+    def set_strikes_count(self, no_of_strikes):
+        '''Resizes the window around the current ATM. The chain thread emits the new
+        window itself, so emits never race a recenter.'''
+        with self.feedJson.changed:
+            self.strikes_count = no_of_strikes
+            self.resized = True
+            self.feedJson.changed.notify_all()
 
-        if strikes is not None:
-            for option in strikes:
-                _,tkn = self.sc.search_scrip(
-                                        symbol = option['symbol'],
-                                        strikeprice = option['strikeprice'],
-                                         optiontype = option['optiontype'],
-                                          expiry = option['expiry'] 
-                                          )
-                token = f"NFO|{tkn}"  
+    def feed_type(self, strike):
+        if self.atm_strike is not None and abs(strike - self.atm_strike) <= self.depth_strikes * self.strikediff:
+            return FeedType.SNAPQUOTE
+        return FeedType.TOUCHLINE
 
-                if option['strikeprice'] not in tokendict:
-                    tokendict[option['strikeprice']] = []
+    def emit_window(self):
+        '''Emits chain_list_ready with {"NFO|token": FeedType} for every expiry (per expiry
+        the CE ladder high to low, then PE) and chains_ready with
+        {expiry: {strike: [CE, PE]}}.'''
+        tokenlist = {}
+        chains = {}
+        for expiry, ladder in self.ladders.items():
+            if not ladder:
+                print(f"{self.symbol} :: No strikes listed for {expiry}")
+                continue
+            strikes, ce_tokens, pe_tokens = ladder.window(self.atm_strike, self.strikes_count)
+            strikes = strikes.tolist()[::-1]
+            ce_tokens = ce_tokens.tolist()[::-1]
+            pe_tokens = pe_tokens.tolist()[::-1]
 
-                tokendict[option['strikeprice']].append({"optiontype": option['optiontype'], "token": tkn})
-        
-                tokenlist.append(token)
-            self.chain_list_ready.emit(tokenlist)  
-            self.tokendict_ready.emit(tokendict)
-            #print(tokendict)
+            feed_types = [self.feed_type(strike) for strike in strikes]
+            tokenlist.update({f"{self.exchange}|{tkn}": feed_type for tkn, feed_type in zip(ce_tokens, feed_types)})
+            tokenlist.update({f"{self.exchange}|{tkn}": feed_type for tkn, feed_type in zip(pe_tokens, feed_types)})
+            chains[expiry] = {
+                strike: [{"optiontype": "CE", "token": ce}, {"optiontype": "PE", "token": pe}]
+                for strike, ce, pe in zip(strikes, ce_tokens, pe_tokens)
+            }
+        if chains:
+            self.chain_list_ready.emit(tokenlist)
+            self.chains_ready.emit(chains)
 
 class WebSocketMonitor(threading.Thread):
     def __init__(self, token, feedJson, max_limit):
@@ -248,16 +370,22 @@ class WebSocketMonitor(threading.Thread):
         '''feedJson is a shared dict here. max_limit is the max allowed freeze time'''
         self.feedJson = feedJson 
         self.token = token
+        self.feedJson.ticks.intern([f"NSE|{self.token}"])
         self.max_limit = max_limit
         self.last_ltp = None
         self.last_error_time = 0
         self.ltp = None
 
     def run(self):
+        clock = FrameClock(2000)
+        version = -1
         while True:
-            tokendict = self.feedJson.read(self.token)
-            if tokendict:
-                self.ltp = float(tokendict['lp'])
+            clock.wait()
+            deadline = self.last_error_time + self.max_limit - time.time()
+            version = self.feedJson.wait_for_change(version, timeout=max(deadline, 0.1))
+            ltp = self.feedJson.ticks.value(self.token, 'lp')
+            if ltp is not None:
+                self.ltp = ltp
 
             if self.ltp is not None:
                 if self.last_ltp is None or self.last_ltp != self.ltp:
@@ -269,5 +397,4 @@ class WebSocketMonitor(threading.Thread):
             else:
                 if time.time() - self.last_error_time >= self.max_limit:
                     print("WARNING :: Check Websocket..")
-                    self.last_error_time = time.time()
-            time.sleep(2)  
\ No newline at end of file
+                    self.last_error_time = time.time()  
\ No newline at end of file